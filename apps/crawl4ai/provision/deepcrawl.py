@@ -0,0 +1,366 @@
+"""Deep crawls for the Crawl4AI server: seeds or sitemaps, link following,
+bounded-memory deduplication and resumable progress.
+
+Each job lives in its own directory under the jobs directory:
+
+    state.json   options, counters, the frontier cursor and the sitemap
+                 files still to read
+    frontier     append-only "depth<TAB>url" lines, crawled in file order
+    seen.bloom   Bloom filter over the hashes of every normalized URL queued
+    lock         flock held while the job runs, so one worker owns it
+
+Only the Bloom filter (about two bytes per URL) and the pages in flight
+are held in memory, however long the frontier grows. Progress is
+checkpointed every half minute; a resumed job starts again from the oldest
+page that was still in flight, so a page can be streamed twice but is never
+lost. Sitemaps are read one file at a time while pages are being crawled,
+and a resumed job re-reads the file it was in (the filter drops repeats).
+"""
+import asyncio
+import fcntl
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import time
+import urllib.request
+import xml.etree.ElementTree as ET
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+CHECKPOINT_SECONDS = 30
+BLOOM_ERROR_RATE = 0.001
+# The filter also remembers links that are never crawled, so size it for
+# many more URLs than max_pages (20M URLs is a 36 MB filter)
+BLOOM_URLS_PER_PAGE = 10
+BLOOM_MIN_CAPACITY = 100_000
+BLOOM_MAX_CAPACITY = 20_000_000
+SITEMAP_MAX_FILES = 1000
+TRACKING_PARAMS = re.compile(r"^(utm_\w+|gclid|fbclid|msclkid|mc_cid|mc_eid|_ga|ref_src)$")
+# Links to these are never HTML pages
+SKIP_EXTENSIONS = re.compile(
+    r"\.(jpe?g|png|gif|webp|svg|ico|bmp|tiff?|mp[34]|m4[av]|webm|avi|mov|wav|ogg|flac|"
+    r"zip|gz|tgz|bz2|xz|7z|rar|tar|exe|dmg|iso|deb|rpm|apk|woff2?|ttf|otf|eot|css|js|"
+    r"pdf|docx?|xlsx?|pptx?)$", re.IGNORECASE)
+
+
+class JobBusy(Exception):
+    """The job is already running in another request or worker."""
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE, bits=None):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, digest):
+        """Add a 16-byte digest; returns False if it was (probably) present."""
+        new = False
+        for pos in self._positions(digest):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        return new
+
+
+def normalize_url(url):
+    """Canonical form used for deduplication, or None for non-HTTP links."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    port = parts.port
+    netloc = host if port in (None, 80 if scheme == "http" else 443) else f"{host}:{port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not TRACKING_PARAMS.match(k)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def url_digest(url):
+    return hashlib.blake2b(url.encode(), digest_size=16).digest()
+
+
+class Scope:
+    """Decides which discovered links a job follows."""
+
+    def __init__(self, mode, roots, include, exclude):
+        self.mode = mode
+        self.hosts = {urlsplit(r).hostname for r in roots}
+        self.domains = {h[4:] if h.startswith("www.") else h for h in self.hosts}
+        self.prefixes = [r if r.endswith("/") else r.rsplit("/", 1)[0] + "/" for r in roots]
+        self.include = [re.compile(p) for p in include]
+        self.exclude = [re.compile(p) for p in exclude]
+
+    def allows(self, url):
+        host = urlsplit(url).hostname
+        if self.mode == "host" and host not in self.hosts:
+            return False
+        if self.mode == "domain" and not any(host == d or host.endswith("." + d) for d in self.domains):
+            return False
+        if self.mode == "prefix" and not any(url.startswith(p) for p in self.prefixes):
+            return False
+        if SKIP_EXTENSIONS.search(urlsplit(url).path):
+            return False
+        if self.include and not any(p.search(url) for p in self.include):
+            return False
+        return not any(p.search(url) for p in self.exclude)
+
+
+def _open_url(url):
+    request = urllib.request.Request(url, headers={"User-Agent": "crawl4ai-appstore sitemap reader",
+                                                   "Accept-Encoding": "gzip"})
+    resp = urllib.request.urlopen(request, timeout=30)
+    if url.endswith(".gz") or resp.headers.get("Content-Encoding") == "gzip":
+        return gzip.GzipFile(fileobj=resp)
+    return resp
+
+
+def read_sitemap(url):
+    """Read one sitemap file, streaming the XML. Blocking; returns the page
+    URLs of a sitemap or the child sitemaps of a sitemap index."""
+    pages, children = [], []
+    try:
+        with _open_url(url) as f:
+            is_index = False
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                tag = elem.tag.rsplit("}", 1)[-1]
+                if event == "start":
+                    is_index = is_index or tag == "sitemapindex"
+                elif tag == "loc" and elem.text:
+                    (children if is_index else pages).append(elem.text.strip())
+                elif tag in ("url", "sitemap"):
+                    elem.clear()
+    except (OSError, ET.ParseError) as e:
+        print(f"sitemap {url}: {e}", flush=True)
+    return pages, children
+
+
+class DeepCrawlJob:
+    def __init__(self, jobs_dir, job_id):
+        self.id = job_id
+        self.dir = os.path.join(jobs_dir, job_id)
+        self.state_path = os.path.join(self.dir, "state.json")
+        self.frontier_path = os.path.join(self.dir, "frontier")
+        self.bloom_path = os.path.join(self.dir, "seen.bloom")
+        self.state = None
+        self.bloom = None
+        self._lock = None
+        self._append = None
+
+    def exists(self):
+        return os.path.exists(self.state_path)
+
+    def load_state(self):
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def acquire(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock = open(os.path.join(self.dir, "lock"), "w")
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock.close()
+            raise JobBusy(self.id)
+
+    def release(self):
+        if self._append:
+            self._append.close()
+        if self._lock:
+            self._lock.close()
+
+    def create(self, options, roots, sitemap=None):
+        max_pages = options["max_pages"]
+        capacity = min(BLOOM_MAX_CAPACITY, max(BLOOM_MIN_CAPACITY, max_pages * BLOOM_URLS_PER_PAGE))
+        self.bloom = BloomFilter(capacity)
+        self.state = {
+            "id": self.id, "status": "starting", "options": options, "roots": roots,
+            "bloom_capacity": capacity, "cursor": 0,
+            "sitemaps": [sitemap] if sitemap else [], "sitemap_files": 0,
+            "pages": 0, "failed": 0, "queued": 0,
+            "created": time.time(), "updated": time.time(),
+        }
+        open(self.frontier_path, "wb").close()
+        self._append = open(self.frontier_path, "ab")
+
+    def resume(self):
+        self.state = self.load_state()
+        with open(self.bloom_path, "rb") as f:
+            self.bloom = BloomFilter(self.state["bloom_capacity"], bits=bytearray(f.read()))
+        self._append = open(self.frontier_path, "ab")
+
+    def enqueue(self, url, depth):
+        """Queue a URL unless an equivalent one was seen before."""
+        url = normalize_url(url)
+        if url is None or not self.bloom.add(url_digest(url)):
+            return False
+        self._append.write(f"{depth}\t{url}\n".encode())
+        self.state["queued"] += 1
+        return True
+
+    def seed(self, seeds):
+        """Queue the seed URLs at depth 0; sitemaps are read by run()."""
+        for url in seeds:
+            self.enqueue(url, 0)
+
+    def snapshot(self, cursor, status=None):
+        """Update the state and copy what a checkpoint writes, so the write
+        itself can happen off the event loop."""
+        self._append.flush()
+        self.state["cursor"] = cursor
+        self.state["updated"] = time.time()
+        if status:
+            self.state["status"] = status
+        return bytes(self.bloom.bits), json.dumps(self.state)
+
+    def write_snapshot(self, snapshot):
+        bloom, state = snapshot
+        self._write(self.bloom_path, bloom, "wb")
+        self._write(self.state_path, state, "w")
+
+    def checkpoint(self, cursor, status=None):
+        self.write_snapshot(self.snapshot(cursor, status))
+
+    def _write(self, path, data, mode):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, mode) as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def make_scope(state):
+    options = state["options"]
+    return Scope(options["scope"], state["roots"], options["include"], options["exclude"])
+
+
+async def _read_sitemaps(job, scope, frontier_grew):
+    """Feed the job's pending sitemap files into the frontier, one at a time.
+
+    Files are fetched and parsed in a thread; queueing happens on the event
+    loop, so the frontier and the filter are only touched from there. A file
+    leaves state["sitemaps"] once all of its entries are queued.
+    """
+    state = job.state
+    while state["sitemaps"] and state["sitemap_files"] < SITEMAP_MAX_FILES:
+        pages, children = await asyncio.to_thread(read_sitemap, state["sitemaps"][0])
+        for n, url in enumerate(pages, 1):
+            normalized = normalize_url(url)
+            if normalized and scope.allows(normalized):
+                job.enqueue(normalized, 0)
+            if n % 1000 == 0:
+                frontier_grew.set()
+                await asyncio.sleep(0)
+        state["sitemaps"].pop(0)
+        state["sitemaps"] += children
+        state["sitemap_files"] += 1
+        frontier_grew.set()
+    state["sitemaps"] = []
+
+
+async def run(job, crawl, make_request, concurrency):
+    """Crawl the job's frontier, yielding one dict per crawled page.
+
+    crawl(request) crawls one page and returns a response with .links;
+    make_request(url) builds that request from the job's options. Pending
+    sitemap files are read alongside. The caller owns acquire()/release()
+    and the first checkpoint.
+    """
+    options = job.state["options"]
+    scope = make_scope(job.state)
+    max_depth, max_pages = options["max_depth"], options["max_pages"]
+    job.state.setdefault("sitemaps", [])
+    job.state.setdefault("sitemap_files", 0)
+
+    reader = open(job.frontier_path, "rb")
+    reader.seek(job.state["cursor"])
+    in_flight = {}  # task -> (offset, depth, url)
+    last_checkpoint = time.monotonic()
+    job.state["status"] = "running"
+    frontier_grew = asyncio.Event()
+    seeder = asyncio.ensure_future(_read_sitemaps(job, scope, frontier_grew)) \
+        if job.state["sitemaps"] else None
+
+    def cursor():
+        return min((offset for offset, _, _ in in_flight.values()), default=reader.tell())
+
+    try:
+        while True:
+            started = job.state["pages"] + job.state["failed"] + len(in_flight)
+            while len(in_flight) < concurrency and started < max_pages:
+                job._append.flush()
+                offset = reader.tell()
+                line = reader.readline()
+                if not line.endswith(b"\n"):
+                    reader.seek(offset)
+                    break
+                depth, url = line.decode().rstrip("\n").split("\t", 1)
+                task = asyncio.ensure_future(crawl(make_request(url)))
+                in_flight[task] = (offset, int(depth), url)
+                started += 1
+            seeding = seeder is not None and not seeder.done() and started < max_pages
+            if not in_flight and not seeding:
+                break
+
+            waits = set(in_flight)
+            waiter = None
+            if seeding and len(in_flight) < concurrency:
+                # Out of queued pages: also wake up when the sitemap adds some
+                frontier_grew.clear()
+                waiter = asyncio.ensure_future(frontier_grew.wait())
+                waits |= {waiter, seeder}
+            done, _ = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            if waiter:
+                waiter.cancel()
+            for task in done & in_flight.keys():
+                _, depth, url = in_flight.pop(task)
+                try:
+                    response = task.result()
+                except Exception as e:
+                    job.state["failed"] += 1
+                    yield {"type": "page", "url": url, "depth": depth, "success": False, "error": str(e)}
+                    continue
+                job.state["pages" if response.success else "failed"] += 1
+                new_links = 0
+                if response.success and depth < max_depth:
+                    for href in response.links or ():
+                        link = normalize_url(urljoin(url, href))
+                        if link and scope.allows(link):
+                            new_links += job.enqueue(link, depth + 1)
+                page = response.model_dump(exclude={"links"} if not options["include_links"] else None)
+                yield {"type": "page", "depth": depth, "new_links": new_links, **page}
+
+            if time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+                # The filter can be tens of MB: write it without blocking the worker
+                await asyncio.to_thread(job.write_snapshot, job.snapshot(cursor()))
+                last_checkpoint = time.monotonic()
+
+        if seeder and seeder.done() and not seeder.cancelled() and seeder.exception():
+            print(f"deep crawl {job.id}: sitemap reader failed: {seeder.exception()}", flush=True)
+        job.checkpoint(reader.tell(), "completed")
+        yield {"type": "done", **_summary(job)}
+    finally:
+        # Client went away or the worker is stopping: keep what was done.
+        # A cancelled reader never touches the job again, so the caller can
+        # release it straight away.
+        if seeder:
+            seeder.cancel()
+        for task in in_flight:
+            task.cancel()
+        if job.state["status"] == "running":
+            job.checkpoint(cursor(), "paused")
+        reader.close()
+
+
+def _summary(job):
+    return {key: job.state[key] for key in ("id", "status", "pages", "failed", "queued")}
@@ -1,7 +1,49 @@
 """Crawl4AI — AI-powered web crawler with REST API."""
 
+import os
+
 from appstore import BaseApp, run
 
+# Headless Chromium plus a worker's Python heap, per server worker
+WORKER_MEMORY_MB = 512
+
+# Analytics and ad hosts that never carry page text
+DEFAULT_BLOCK_DOMAINS = ",".join([
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "googlesyndication.com", "adservice.google.com", "facebook.net",
+    "connect.facebook.net", "hotjar.com", "segment.io", "scorecardresearch.com",
+    "quantserve.com", "criteo.com", "taboola.com", "outbrain.com",
+])
+
+
+def _container_cores():
+    """CPU cores available to this container (cpuset, then cgroup v2 quota)."""
+    cores = len(os.sched_getaffinity(0))
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def _container_memory_mb():
+    """Memory available to this container (cgroup v2 limit, then /proc/meminfo)."""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            return int(limit) // (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    return 0
+
 
 class Crawl4AIApp(BaseApp):
     def install(self):
@@ -10,6 +52,13 @@ class Crawl4AIApp(BaseApp):
         max_concurrent = self.inputs.integer("max_concurrent", 5)
         cache_dir = self.inputs.string("cache_dir", "/var/lib/crawl4ai/cache")
         headless = self.inputs.boolean("headless", True)
+        workers = self.inputs.integer("workers", 0)
+        fetch_mode = self.inputs.string("fetch_mode", "browser")
+        block_resources = self.inputs.string("block_resources", "image,media,font")
+        block_domains = self.inputs.string("block_domains", DEFAULT_BLOCK_DOMAINS)
+        per_host_concurrency = self.inputs.integer("per_host_concurrency", 2)
+        per_host_delay_ms = self.inputs.integer("per_host_delay_ms", 250)
+        max_retries = self.inputs.integer("max_retries", 3)
 
         # Install system dependencies
         self.pkg_install(
@@ -32,6 +81,8 @@ class Crawl4AIApp(BaseApp):
 
         # Deploy server and playground files
         self.deploy_provision_file("server.py", "/opt/crawl4ai/server.py")
+        self.deploy_provision_file("scheduler.py", "/opt/crawl4ai/scheduler.py")
+        self.deploy_provision_file("deepcrawl.py", "/opt/crawl4ai/deepcrawl.py")
         self.deploy_provision_file("playground.html", "/opt/crawl4ai/playground.html")
 
         # Set ownership before installing browsers so they land in the right cache
@@ -42,6 +93,8 @@ class Crawl4AIApp(BaseApp):
         self.run_command(["su", "-s", "/bin/bash", "crawl4ai", "-c",
                           "/opt/crawl4ai/venv/bin/playwright install chromium"])
 
+        workers = self._worker_count(workers, max_concurrent)
+
         # Create systemd service
         self.create_service("crawl4ai",
             exec_start="/opt/crawl4ai/venv/bin/python /opt/crawl4ai/server.py",
@@ -55,11 +108,34 @@ class Crawl4AIApp(BaseApp):
                 "CRAWL4AI_MAX_CONCURRENT": str(max_concurrent),
                 "CRAWL4AI_CACHE_DIR": cache_dir,
                 "CRAWL4AI_HEADLESS": str(headless).lower(),
+                "CRAWL4AI_WORKERS": str(workers),
+                "CRAWL4AI_FETCH_MODE": fetch_mode,
+                "CRAWL4AI_BLOCK_RESOURCES": block_resources.replace(" ", ""),
+                "CRAWL4AI_BLOCK_DOMAINS": block_domains.replace(" ", ""),
+                "CRAWL4AI_PER_HOST_CONCURRENCY": str(per_host_concurrency),
+                "CRAWL4AI_PER_HOST_DELAY_MS": str(per_host_delay_ms),
+                "CRAWL4AI_MAX_RETRIES": str(max_retries),
+                # crawl4ai keeps its result cache under $CRAWL4_AI_BASE_DIRECTORY/.crawl4ai;
+                # pointing it at cache_dir shares one cache between all workers
+                "CRAWL4_AI_BASE_DIRECTORY": cache_dir,
             },
             restart="on-failure",
             restart_sec=5,
         )
-        self.log.info("Crawl4AI installed successfully")
+        self.log.info(f"Crawl4AI installed successfully ({workers} worker(s))")
+
+    def _worker_count(self, workers, max_concurrent):
+        """Server processes to run: the requested count, or one per core that
+        memory allows. Never more than max_concurrent, since every worker
+        keeps at least one browser page open."""
+        if workers > 0:
+            return min(workers, max_concurrent)
+        cores = _container_cores()
+        memory_mb = _container_memory_mb()
+        fit = max(1, memory_mb // WORKER_MEMORY_MB)
+        workers = max(1, min(cores, fit, max_concurrent))
+        self.log.info(f"Auto-sized to {workers} worker(s) for {cores} cores and {memory_mb} MB")
+        return workers
 
 
 run(Crawl4AIApp)
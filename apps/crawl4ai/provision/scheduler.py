@@ -0,0 +1,208 @@
+"""Per-host politeness scheduling for the Crawl4AI server.
+
+A crawl first waits for a slot on its target host, then for one of the
+worker's browser slots. Crawls queued behind a busy or rate-limited host
+never hold a browser slot, so the remaining hosts keep the worker busy.
+
+Host limits hold across all server workers. Each host gets a directory
+under the state directory with one flock'ed file per slot and a small JSON
+state file (next allowed start, backoff) that every worker updates under
+its own flock. A worker that dies releases its slots with its locks.
+
+Each host slot maps to a crawl4ai session, so consecutive crawls of a host
+from one worker reuse the same page (and its connections) instead of
+opening a new one.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# Ceiling for the adaptive backoff after 429/503 answers
+MAX_BACKOFF = 300.0
+# Sessions unused for this long are closed
+SESSION_IDLE = 300.0
+# How often a crawl waiting on a host re-checks slots held by other workers
+SLOT_POLL = 0.1
+# Host state not touched for this long is removed at startup
+HOST_STATE_TTL = 24 * 3600
+
+
+class _Host:
+    def __init__(self, path, concurrency):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.concurrency = concurrency
+        self.held = set()
+        self.slot_fds = {}
+        self.state_fd = os.open(os.path.join(path, "state"), os.O_RDWR | os.O_CREAT, 0o644)
+        self.available = asyncio.Condition()
+        self.users = 0
+        self.sessions = {}
+
+    def try_acquire(self):
+        """Lock a slot no crawl in any worker holds; returns its index or None."""
+        for index in range(self.concurrency):
+            if index in self.held:
+                continue
+            fd = self.slot_fds.get(index)
+            if fd is None:
+                fd = os.open(os.path.join(self.path, f"slot-{index}"), os.O_RDWR | os.O_CREAT, 0o644)
+                self.slot_fds[index] = fd
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            self.held.add(index)
+            return index
+        return None
+
+    def release(self, index):
+        fcntl.flock(self.slot_fds[index], fcntl.LOCK_UN)
+        self.held.discard(index)
+
+    @contextmanager
+    def state(self):
+        """Read-modify-write the shared next_start/backoff record."""
+        fcntl.flock(self.state_fd, fcntl.LOCK_EX)
+        try:
+            raw = os.pread(self.state_fd, 4096, 0)
+            try:
+                state = json.loads(raw) if raw else {}
+            except ValueError:
+                state = {}
+            before = dict(state)
+            yield state
+            if state != before:
+                data = json.dumps(state).encode()
+                os.pwrite(self.state_fd, data, 0)
+                os.ftruncate(self.state_fd, len(data))
+        finally:
+            fcntl.flock(self.state_fd, fcntl.LOCK_UN)
+
+    def close(self):
+        for fd in [self.state_fd, *self.slot_fds.values()]:
+            os.close(fd)
+
+
+class HostScheduler:
+    def __init__(self, global_slots, per_host, delay, state_dir):
+        self.global_slots = global_slots
+        self.per_host = max(1, per_host)
+        self.delay = max(0.0, delay)
+        self.state_dir = state_dir
+        self.hosts = {}
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _host(self, host):
+        if host not in self.hosts:
+            digest = hashlib.blake2b(host.encode(), digest_size=16).hexdigest()
+            self.hosts[host] = _Host(os.path.join(self.state_dir, digest), self.per_host)
+        return self.hosts[host]
+
+    @asynccontextmanager
+    async def slot(self, url, session_key=""):
+        """Hold a host slot and a browser slot; yields the session id to crawl with."""
+        name = (urlsplit(url).hostname or "").lower()
+        host = self._host(name)
+        host.users += 1
+        try:
+            async with host.available:
+                # Local releases notify; slots freed by other workers are polled
+                while (index := host.try_acquire()) is None:
+                    try:
+                        await asyncio.wait_for(host.available.wait(), SLOT_POLL)
+                    except asyncio.TimeoutError:
+                        pass
+            try:
+                # Reserve the next start time for this host before sleeping, so
+                # concurrent crawls of the same host are spaced out too
+                with host.state() as state:
+                    now = time.time()
+                    start = max(now, state.get("next_start", 0.0))
+                    state["next_start"] = start + self.delay + state.get("backoff", 0.0)
+                if start > now:
+                    await asyncio.sleep(start - now)
+                session_id = f"{name}#{index}#{session_key}"
+                # An open session is never reaped while it is in use
+                host.sessions.pop(session_id, None)
+                try:
+                    async with self.global_slots:
+                        yield session_id
+                finally:
+                    host.sessions[session_id] = time.monotonic()
+            finally:
+                host.release(index)
+                async with host.available:
+                    host.available.notify()
+        finally:
+            host.users -= 1
+
+    def throttled(self, url, retry_after=None):
+        """Back off a host after a 429/503; returns the seconds to wait before retrying."""
+        host = self._host((urlsplit(url).hostname or "").lower())
+        with host.state() as state:
+            backoff = min(MAX_BACKOFF, max(1.0, state.get("backoff", 0.0) * 2))
+            wait = max(backoff, retry_after or 0.0)
+            state["backoff"] = backoff
+            state["next_start"] = max(state.get("next_start", 0.0), time.time() + wait)
+        return wait
+
+    def succeeded(self, url):
+        host = self.hosts.get((urlsplit(url).hostname or "").lower())
+        if host:
+            with host.state() as state:
+                backoff = state.get("backoff", 0.0)
+                if backoff:
+                    state["backoff"] = backoff / 2 if backoff > 1.0 else 0.0
+
+    def idle_sessions(self, max_open):
+        """Pop and return session ids to close: those unused for SESSION_IDLE
+        seconds, then the least recently used beyond max_open."""
+        cutoff = time.monotonic() - SESSION_IDLE
+        parked = sorted((last_used, session_id, host)
+                        for host in self.hosts.values()
+                        for session_id, last_used in host.sessions.items())
+        excess = len(parked) - max_open
+        idle = []
+        for n, (last_used, session_id, host) in enumerate(parked):
+            if last_used < cutoff or n < excess:
+                del host.sessions[session_id]
+                idle.append(session_id)
+        # Forget hosts with nothing running, queued or parked in this worker;
+        # their spacing and backoff stay in the shared state file
+        for name, host in list(self.hosts.items()):
+            if not host.sessions and not host.users:
+                host.close()
+                del self.hosts[name]
+        return idle
+
+    def prune(self):
+        """Remove state of hosts no worker has crawled for HOST_STATE_TTL."""
+        cutoff = time.time() - HOST_STATE_TTL
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if os.path.getmtime(os.path.join(path, "state")) < cutoff:
+                    shutil.rmtree(path)
+            except OSError:
+                pass
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -1,63 +1,456 @@
-"""Minimal FastAPI server wrapping crawl4ai."""
+"""Minimal FastAPI server wrapping crawl4ai.
+
+Runs CRAWL4AI_WORKERS uvicorn processes. Each worker starts its own browser
+and serves up to its share of CRAWL4AI_MAX_CONCURRENT crawls at once; the
+result cache, job state and per-host politeness state live under
+CRAWL4AI_CACHE_DIR so every worker sees the same data.
+"""
+import asyncio
+import contextvars
+import json
+import math
 import os
+import shutil
+import time
+import urllib.error
+import urllib.request
+import uuid
+from contextlib import asynccontextmanager
+from email.message import Message
+from urllib.parse import urlsplit
+
 import uvicorn
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 
-app = FastAPI(title="Crawl4AI", version="0.8.0")
+import deepcrawl
+from scheduler import HostScheduler, parse_retry_after
 
 PLAYGROUND_PATH = os.path.join(os.path.dirname(__file__), "playground.html")
+CACHE_DIR = os.getenv("CRAWL4AI_CACHE_DIR", "/var/lib/crawl4ai/cache")
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+HOSTS_DIR = os.path.join(CACHE_DIR, "hosts")
+WORKERS = max(1, int(os.getenv("CRAWL4AI_WORKERS", "1")))
+# Split the browser page budget between workers
+WORKER_CONCURRENCY = max(1, math.ceil(int(os.getenv("CRAWL4AI_MAX_CONCURRENT", "5")) / WORKERS))
+# Finished job records are kept this long; deep crawls stay resumable for longer
+JOB_TTL = 24 * 3600
+DEEP_JOB_TTL = 7 * 24 * 3600
 
 
-class CrawlRequest(BaseModel):
-    url: str
+def _env_list(name, default=""):
+    return [item.strip().lower() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+# Server-wide defaults for requests that do not set their own
+BLOCK_RESOURCES = _env_list("CRAWL4AI_BLOCK_RESOURCES")
+BLOCK_DOMAINS = _env_list("CRAWL4AI_BLOCK_DOMAINS")
+FETCH_MODE = os.getenv("CRAWL4AI_FETCH_MODE", "browser")
+# Playwright resource types that can be blocked
+RESOURCE_TYPES = {"document", "stylesheet", "image", "media", "font", "script", "texttrack",
+                  "xhr", "fetch", "eventsource", "websocket", "manifest", "other"}
+# Plain-HTTP fetches give up on bodies larger than this
+HTTP_MAX_BYTES = 10 * 1024 * 1024
+HTTP_USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/120.0 Safari/537.36")
+
+# Per-host politeness, enforced across all workers through HOSTS_DIR
+PER_HOST_CONCURRENCY = max(1, int(os.getenv("CRAWL4AI_PER_HOST_CONCURRENCY", "2")))
+PER_HOST_DELAY = int(os.getenv("CRAWL4AI_PER_HOST_DELAY_MS", "250")) / 1000
+MAX_RETRIES = int(os.getenv("CRAWL4AI_MAX_RETRIES", "3"))
+THROTTLE_CODES = (429, 503)
+# Host sessions (open pages) a worker keeps parked for reuse
+MAX_SESSIONS = WORKER_CONCURRENCY * 4
+BATCH_MAX_URLS = 1000
+# Pages a deep crawl keeps in flight; more than the page budget so that
+# crawls waiting on a busy host do not idle the browser
+DEEP_CONCURRENCY = WORKER_CONCURRENCY * 2
+
+# Blocking rules of the crawl running in the current task, read by the page hook
+_blocking = contextvars.ContextVar("blocking", default=None)
+
+
+class Pool:
+    """This worker's browser and the slots that bound its open pages."""
+    crawler: Optional[AsyncWebCrawler] = None
+    slots: Optional[asyncio.Semaphore] = None
+    scheduler: Optional[HostScheduler] = None
+    # Strong references so running job tasks are not garbage collected
+    tasks: set = set()
+
+
+def _prune_jobs():
+    now = time.time()
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        try:
+            if os.path.isdir(path):
+                if os.path.getmtime(path) < now - DEEP_JOB_TTL:
+                    shutil.rmtree(path)
+            elif os.path.getmtime(path) < now - JOB_TTL:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+@asynccontextmanager
+async def lifespan(app):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    _prune_jobs()
+    Pool.crawler = AsyncWebCrawler(
+        config=BrowserConfig(headless=os.getenv("CRAWL4AI_HEADLESS", "true").lower() == "true"))
+    Pool.crawler.crawler_strategy.set_hook("on_page_context_created", _block_requests)
+    await Pool.crawler.start()
+    Pool.slots = asyncio.Semaphore(WORKER_CONCURRENCY)
+    Pool.scheduler = HostScheduler(Pool.slots, PER_HOST_CONCURRENCY, PER_HOST_DELAY, HOSTS_DIR)
+    Pool.scheduler.prune()
+    reaper = asyncio.create_task(_reap_sessions())
+    try:
+        yield
+    finally:
+        reaper.cancel()
+        await Pool.crawler.close()
+
+
+async def _reap_sessions():
+    """Close host sessions that went idle or exceed the parked-page budget."""
+    while True:
+        await asyncio.sleep(10)
+        for session_id in Pool.scheduler.idle_sessions(MAX_SESSIONS):
+            try:
+                await Pool.crawler.crawler_strategy.kill_session(session_id)
+            except Exception:
+                pass
+
+
+app = FastAPI(title="Crawl4AI", version="0.8.0", lifespan=lifespan)
+
+
+class CrawlOptions(BaseModel):
     word_count_threshold: int = Field(default=10)
     bypass_cache: bool = Field(default=False)
     css_selector: Optional[str] = None
+    # Unset fields fall back to the server defaults
+    block_resources: Optional[List[str]] = Field(
+        default=None, description="Playwright resource types to abort, e.g. image, font, media, script")
+    block_domains: Optional[List[str]] = Field(
+        default=None, description="Hosts whose requests are aborted; subdomains match too")
+    fetch_mode: Optional[str] = Field(
+        default=None, pattern="^(browser|http)$",
+        description="browser renders the page in Chromium; http fetches the HTML without running scripts")
+    include_links: bool = Field(default=False, description="Return the links found on the page")
+
+
+class CrawlRequest(CrawlOptions):
+    url: str
+
+
+class BatchRequest(CrawlOptions):
+    """Crawl many URLs with the same options; hosts are interleaved by the scheduler."""
+    urls: List[str] = Field(min_length=1, max_length=BATCH_MAX_URLS)
+
+
+class DeepCrawlRequest(CrawlOptions):
+    """Crawl outward from seed URLs and/or a sitemap, or resume an earlier job."""
+    seeds: List[str] = Field(default_factory=list)
+    sitemap: Optional[str] = Field(default=None, description="sitemap or sitemap index URL")
+    resume: Optional[str] = Field(default=None, description="id of a paused job to continue")
+    max_depth: int = Field(default=2, ge=0, le=100, description="link hops from a seed")
+    max_pages: int = Field(default=1000, ge=1, le=10_000_000)
+    scope: str = Field(default="host", pattern="^(host|domain|prefix|any)$",
+                       description="host: the seeds' hosts; domain: also their subdomains; "
+                                   "prefix: below the seeds' paths; any: follow every link")
+    include: List[str] = Field(default_factory=list, description="regexes a followed URL must match")
+    exclude: List[str] = Field(default_factory=list, description="regexes of URLs never followed")
 
 
 class CrawlResponse(BaseModel):
     url: str
     success: bool
+    status_code: Optional[int] = None
     markdown: Optional[str] = None
     cleaned_html: Optional[str] = None
+    links: Optional[List[str]] = None
+    error: Optional[str] = None
+
+
+class Job(BaseModel):
+    id: str
+    status: str
+    created: float
+    updated: float
+    result: Optional[CrawlResponse] = None
     error: Optional[str] = None
 
 
+def _normalize_url(url):
+    url = url.strip()
+    if not url.startswith(("http://", "https://", "file://", "raw:")):
+        url = "https://" + url
+    return url
+
+
+def _host_blocked(host, domains):
+    return bool(host) and any(host == d or host.endswith("." + d) for d in domains)
+
+
+async def _block_requests(page, context=None, **kwargs):
+    """Abort blocked resource types and hosts before Chromium downloads them."""
+    rules = _blocking.get()
+    if not rules:
+        return page
+    types, domains = rules
+
+    async def route(route):
+        request = route.request
+        if request.resource_type in types or _host_blocked(urlsplit(request.url).hostname, domains):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await page.route("**/*", route)
+    return page
+
+
+def _http_fetch(url):
+    """GET a page without a browser; returns decoded HTML."""
+    request = urllib.request.Request(url, headers={
+        "User-Agent": HTTP_USER_AGENT,
+        "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+    })
+    with urllib.request.urlopen(request, timeout=30) as resp:
+        ctype = resp.headers.get("Content-Type", "")
+        if ctype and "html" not in ctype and "xml" not in ctype and "text" not in ctype:
+            raise ValueError(f"not an HTML page ({ctype})")
+        body = resp.read(HTTP_MAX_BYTES + 1)
+    if len(body) > HTTP_MAX_BYTES:
+        raise ValueError(f"page larger than {HTTP_MAX_BYTES // 1048576} MB")
+    header = Message()
+    header["Content-Type"] = ctype
+    return body.decode(header.get_content_charset() or "utf-8", errors="replace")
+
+
+async def _crawl(req: CrawlRequest) -> CrawlResponse:
+    """Crawl one URL under the host scheduler, retrying 429/503 answers with backoff."""
+    req.url = _normalize_url(req.url)
+    fetch_mode = req.fetch_mode or FETCH_MODE
+    types = BLOCK_RESOURCES if req.block_resources is None else req.block_resources
+    domains = BLOCK_DOMAINS if req.block_domains is None else req.block_domains
+    types = sorted({t.strip().lower() for t in types} & RESOURCE_TYPES)
+    domains = sorted(d.strip().lower().lstrip(".") for d in domains if d.strip())
+    rules = (set(types), domains) if types or domains else None
+
+    cache_mode = CacheMode.BYPASS if req.bypass_cache else CacheMode.ENABLED
+    if not req.url.startswith(("http://", "https://")):
+        # file:// and raw: content has no host to be polite to
+        _blocking.set(rules)
+        async with Pool.slots:
+            return (await _crawl_once(req, req.url, cache_mode, None))[0]
+
+    # Pages are routed with the rules of the crawl that opened them, so a host
+    # session is only reused by crawls with the same rules
+    session_key = "%x" % (hash((fetch_mode, tuple(types), tuple(domains))) & 0xFFFFFFFF)
+    for attempt in range(MAX_RETRIES + 1):
+        async with Pool.scheduler.slot(req.url, session_key) as session_id:
+            _blocking.set(rules)
+            if fetch_mode == "http":
+                response, retry_after = await _crawl_http(req)
+            else:
+                response, retry_after = await _crawl_once(req, req.url, cache_mode, session_id)
+        if response.status_code not in THROTTLE_CODES:
+            Pool.scheduler.succeeded(req.url)
+            return response
+        Pool.scheduler.throttled(req.url, retry_after)
+        # A throttled answer must not be served from the cache on retry
+        cache_mode = CacheMode.BYPASS
+    return response
+
+
+async def _crawl_http(req: CrawlRequest):
+    """Fetch the HTML without a browser and hand it to crawl4ai as raw: content,
+    which it converts without opening a page. Raw content is not cached."""
+    try:
+        html = await asyncio.to_thread(_http_fetch, req.url)
+    except urllib.error.HTTPError as e:
+        response = CrawlResponse(url=req.url, success=False, status_code=e.code,
+                                 error=f"HTTP {e.code} {e.reason}")
+        return response, parse_retry_after(e.headers.get("Retry-After"))
+    response, _ = await _crawl_once(req, "raw:" + html, CacheMode.BYPASS, None)
+    response.status_code = 200
+    return response, None
+
+
+async def _crawl_once(req: CrawlRequest, url, cache_mode, session_id):
+    """Run one crawl; returns the response and the Retry-After delay, if any."""
+    run_cfg = CrawlerRunConfig(
+        word_count_threshold=req.word_count_threshold,
+        cache_mode=cache_mode,
+        css_selector=req.css_selector,
+        session_id=session_id,
+    )
+    result = await Pool.crawler.arun(url=url, config=run_cfg)
+    response = CrawlResponse(
+        url=req.url,
+        success=result.success,
+        status_code=result.status_code,
+        markdown=result.markdown.raw_markdown if result.markdown else None,
+        cleaned_html=result.cleaned_html,
+        error=result.error_message if not result.success else None,
+    )
+    if req.include_links and result.links:
+        response.links = [link["href"] for kind in ("internal", "external")
+                          for link in result.links.get(kind, []) if link.get("href")]
+    headers = {k.lower(): v for k, v in (result.response_headers or {}).items()}
+    return response, parse_retry_after(headers.get("retry-after"))
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _save_job(job: Job):
+    """Write job state atomically so any worker can read it back."""
+    job.updated = time.time()
+    tmp = _job_path(job.id) + f".{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(job.model_dump_json())
+    os.replace(tmp, _job_path(job.id))
+
+
+async def _run_job(job: Job, req: CrawlRequest):
+    try:
+        job.result = await _crawl(req)
+        job.status = "completed"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+    _save_job(job)
+
+
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "pid": os.getpid(), "workers": WORKERS,
+            "worker_concurrency": WORKER_CONCURRENCY, "fetch_mode": FETCH_MODE,
+            "block_resources": BLOCK_RESOURCES, "block_domains": BLOCK_DOMAINS,
+            "per_host_concurrency": PER_HOST_CONCURRENCY, "per_host_delay": PER_HOST_DELAY,
+            "hosts": len(Pool.scheduler.hosts)}
 
 
 @app.post("/crawl", response_model=CrawlResponse)
 async def crawl(req: CrawlRequest):
     try:
-        url = req.url.strip()
-        if not url.startswith(("http://", "https://", "file://", "raw:")):
-            url = "https://" + url
-        req.url = url
-        browser_cfg = BrowserConfig(headless=os.getenv("CRAWL4AI_HEADLESS", "true").lower() == "true")
-        run_cfg = CrawlerRunConfig(
-            word_count_threshold=req.word_count_threshold,
-            cache_mode=CacheMode.BYPASS if req.bypass_cache else CacheMode.ENABLED,
-            css_selector=req.css_selector,
-        )
-        async with AsyncWebCrawler(config=browser_cfg) as crawler:
-            result = await crawler.arun(url=req.url, config=run_cfg)
-            return CrawlResponse(
-                url=req.url,
-                success=result.success,
-                markdown=result.markdown.raw_markdown if result.markdown else None,
-                cleaned_html=result.cleaned_html,
-                error=result.error_message if not result.success else None,
-            )
+        return await _crawl(req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/crawl/batch", response_model=List[CrawlResponse])
+async def crawl_batch(req: BatchRequest):
+    """Crawl every URL concurrently; results come back in request order."""
+    options = req.model_dump(exclude={"urls"})
+
+    async def one(url):
+        try:
+            return await _crawl(CrawlRequest(url=url, **options))
+        except Exception as e:
+            return CrawlResponse(url=url, success=False, error=str(e))
+
+    return await asyncio.gather(*(one(url) for url in req.urls))
+
+
+@app.post("/crawl/deep")
+async def crawl_deep(req: DeepCrawlRequest):
+    """Stream a deep crawl as NDJSON: a job line, one line per page, then a done line.
+
+    Progress is checkpointed under the cache directory; if the stream is cut
+    the job is paused and can be continued with {"resume": "<id>"}.
+    """
+    if req.resume:
+        if not req.resume.isalnum():
+            raise HTTPException(status_code=404, detail="job not found")
+        job = deepcrawl.DeepCrawlJob(JOBS_DIR, req.resume)
+        if not job.exists():
+            raise HTTPException(status_code=404, detail="job not found")
+    else:
+        seeds = [_normalize_url(url) for url in req.seeds]
+        if not seeds and not req.sitemap:
+            raise HTTPException(status_code=400, detail="give seeds, a sitemap or a job to resume")
+        job = deepcrawl.DeepCrawlJob(JOBS_DIR, uuid.uuid4().hex)
+    try:
+        job.acquire()
+    except deepcrawl.JobBusy:
+        raise HTTPException(status_code=409, detail="job is already running")
+
+    try:
+        if req.resume:
+            job.resume()
+            if job.state["status"] == "completed":
+                job.release()
+                raise HTTPException(status_code=409, detail="job already completed")
+        else:
+            options = req.model_dump(include={"max_depth", "max_pages", "scope", "include",
+                                              "exclude", "include_links"})
+            options["crawl"] = req.model_dump(include=set(CrawlOptions.model_fields) - {"include_links"})
+            sitemap = _normalize_url(req.sitemap) if req.sitemap else None
+            job.create(options, seeds + ([sitemap] if sitemap else []), sitemap)
+            job.seed(seeds)
+            job.checkpoint(0)
+    except HTTPException:
+        raise
+    except Exception:
+        job.release()
+        raise
+
+    crawl_options = job.state["options"]["crawl"]
+
+    async def stream():
+        try:
+            yield json.dumps({"type": "job", "id": job.id, "resumed": bool(req.resume)}) + "\n"
+            pages = deepcrawl.run(job, _crawl,
+                                  lambda url: CrawlRequest(url=url, include_links=True, **crawl_options),
+                                  DEEP_CONCURRENCY)
+            async for item in pages:
+                yield json.dumps(item) + "\n"
+        finally:
+            job.release()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/crawl/deep/{job_id}")
+async def deep_status(job_id: str):
+    job = deepcrawl.DeepCrawlJob(JOBS_DIR, job_id)
+    if not job_id.isalnum() or not job.exists():
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.load_state()
+
+
+@app.post("/jobs", response_model=Job, status_code=202)
+async def submit_job(req: CrawlRequest):
+    """Queue a crawl on this worker; poll GET /jobs/{id} from any worker."""
+    now = time.time()
+    job = Job(id=uuid.uuid4().hex, status="running", created=now, updated=now)
+    _save_job(job)
+    task = asyncio.create_task(_run_job(job, req))
+    Pool.tasks.add(task)
+    task.add_done_callback(Pool.tasks.discard)
+    return job
+
+
+@app.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    if not job_id.isalnum():
+        raise HTTPException(status_code=404, detail="job not found")
+    try:
+        with open(_job_path(job_id)) as f:
+            return Job(**json.load(f))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="job not found")
+
+
 @app.get("/playground", response_class=HTMLResponse)
 async def playground():
     with open(PLAYGROUND_PATH) as f:
@@ -65,5 +458,6 @@ async def playground():
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host=os.getenv("CRAWL4AI_HOST", "0.0.0.0"),
-                port=int(os.getenv("CRAWL4AI_API_PORT", "11235")))
+    # An import string lets uvicorn start each worker in its own process
+    uvicorn.run("server:app", host=os.getenv("CRAWL4AI_HOST", "0.0.0.0"),
+                port=int(os.getenv("CRAWL4AI_API_PORT", "11235")), workers=WORKERS)
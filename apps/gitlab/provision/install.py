@@ -1,13 +1,118 @@
 #!/usr/bin/env python3
 """GitLab CE — self-hosted DevOps platform."""
+import hashlib
+import json
 import os
 from urllib.parse import urlparse
 from appstore import BaseApp, run
 
 GITLAB_RB = "/etc/gitlab/gitlab.rb"
+GITLAB_VERSION = "/opt/gitlab/embedded/service/gitlab-rails/VERSION"
+# runit service links created by the first reconfigure in this rootfs
+RUNIT_SERVICES = "/opt/gitlab/service"
+# Hashes of what configure() last applied — on the data volume, next to the DB
+STATE_FILE = "/var/opt/gitlab/.appstore-config.json"
+
+# Memory a Puma worker grows to before it is recycled (GitLab default)
+PUMA_WORKER_MB = 1200
+
+
+def _container_cores():
+    """CPU cores available to this container (cpuset, then cgroup v2 quota)."""
+    cores = len(os.sched_getaffinity(0))
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def _container_memory_mb():
+    """Memory available to this container (cgroup v2 limit, then /proc/meminfo)."""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            return int(limit) // (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    return 0
 
 
 class GitLabApp(BaseApp):
+    def _tuning(self, profile, cores, memory_mb):
+        """Size Puma, Sidekiq, PostgreSQL and Gitaly for this container.
+
+        low-memory runs Puma in single mode and keeps buffers small so GitLab
+        fits in ~4 GB; throughput gives Puma and Sidekiq every core the memory
+        can back and hands most of the RAM to PostgreSQL's cache.
+        """
+        if profile == "low-memory":
+            puma_workers = 0
+            sidekiq = 5
+            shared_buffers = max(128, memory_mb // 10)
+            work_mem = 8
+            cache_share = 0.25
+            gitaly_share = 0.3
+        elif profile == "throughput":
+            puma_workers = max(2, min(cores, (memory_mb - 3072) // PUMA_WORKER_MB))
+            sidekiq = min(50, max(10, cores * 10))
+            shared_buffers = min(8192, memory_mb // 4)
+            work_mem = 32
+            cache_share = 0.75
+            gitaly_share = 0.5
+        else:
+            puma_workers = max(2, min(cores, (memory_mb - 4096) // PUMA_WORKER_MB))
+            sidekiq = min(20, max(5, cores * 5))
+            shared_buffers = min(4096, memory_mb // 4)
+            work_mem = 16
+            cache_share = 0.5
+            gitaly_share = 0.4
+
+        gitaly_memory_bytes = int(memory_mb * gitaly_share) * 1024 * 1024
+        return {
+            "puma_workers": puma_workers,
+            "puma_threads": 4,
+            "sidekiq_concurrency": sidekiq,
+            "shared_buffers": f"{shared_buffers}MB",
+            "work_mem": f"{work_mem}MB",
+            "effective_cache_size": f"{int(memory_mb * cache_share)}MB",
+            "gitaly_memory_bytes": gitaly_memory_bytes,
+            "gitaly_repo_cgroups": max(2, cores * 2),
+            "gitaly_repo_memory_bytes": gitaly_memory_bytes // 2,
+            "low_memory": profile == "low-memory",
+            "tuning_summary": f"{profile} profile for {cores} cores / {memory_mb} MB",
+        }
+
+    def _load_state(self):
+        try:
+            with open(STATE_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, state):
+        self.write_config(STATE_FILE, json.dumps(state, indent=2) + "\n")
+
+    def _rendered_hash(self):
+        """Hash of the rendered gitlab.rb plus the installed GitLab version."""
+        sha = hashlib.sha256()
+        with open(GITLAB_RB, "rb") as f:
+            sha.update(f.read())
+        try:
+            with open(GITLAB_VERSION, "rb") as f:
+                sha.update(f.read())
+        except FileNotFoundError:
+            pass
+        return sha.hexdigest()
+
     def install(self):
         # Prerequisites — locales required for PostgreSQL initdb
         self.pkg_install("curl", "openssh-server", "ca-certificates", "tzdata", "perl", "locales")
@@ -48,13 +153,18 @@ class GitLabApp(BaseApp):
         self.log.info("GitLab CE installed successfully")
 
     def configure(self):
-        """Write gitlab.rb from template and reconfigure. Called by install() and reconfigure."""
+        """Write gitlab.rb from template and reconfigure. Called by install() and reconfigure.
+
+        Each phase is skipped when what it applies is unchanged since the last run.
+        """
         external_url = self.inputs.string("external_url", "")
         gitlab_port = self.inputs.integer("gitlab_port", 80)
         ssh_port = self.inputs.integer("ssh_port", 22)
         registry_enabled = self.inputs.boolean("registry_enabled", False)
         pages_enabled = self.inputs.boolean("pages_enabled", False)
         require_email = self.inputs.boolean("require_email_confirmation", False)
+        profile = self.inputs.string("performance_profile", "balanced")
+        gitaly_cgroups = self.inputs.boolean("gitaly_cgroups", False)
 
         if not external_url:
             external_url = f"http://{os.environ.get('CONTAINER_IP', 'localhost')}"
@@ -65,6 +175,17 @@ class GitLabApp(BaseApp):
 
         hostname = urlparse(external_url).hostname or "localhost"
 
+        cores = _container_cores()
+        memory_mb = _container_memory_mb()
+        if memory_mb < 4096 and profile != "low-memory":
+            self.log.warn(f"Only {memory_mb} MB RAM — the low-memory profile is recommended below 4 GB")
+        tuning = self._tuning(profile, cores, memory_mb)
+        self.log.info(
+            f"Tuning for {cores} cores / {memory_mb} MB ({profile}): "
+            f"puma workers={tuning['puma_workers']}, sidekiq={tuning['sidekiq_concurrency']}, "
+            f"shared_buffers={tuning['shared_buffers']}"
+        )
+
         self.render_template("gitlab.rb.tmpl", GITLAB_RB,
             external_url=external_url,
             gitlab_port=gitlab_port,
@@ -73,22 +194,55 @@ class GitLabApp(BaseApp):
             registry_enabled=registry_enabled,
             pages_enabled=pages_enabled,
             send_confirmation_email="true" if require_email else "false",
+            gitaly_cgroups=gitaly_cgroups,
+            **tuning,
         )
 
-        # Reconfigure GitLab to apply changes
-        self.log.info("Running gitlab-ctl reconfigure (this may take a few minutes)...")
-        self.run_command(["gitlab-ctl", "reconfigure"])
+        state = self._load_state()
+
+        # Reconfigure only when gitlab.rb or the package changed, or this rootfs
+        # has never been reconfigured (fresh install onto a kept data volume)
+        rb_hash = self._rendered_hash()
+        services_configured = os.path.isdir(RUNIT_SERVICES) and bool(os.listdir(RUNIT_SERVICES))
+        reconfigured = False
+        if rb_hash != state.get("gitlab_rb") or not services_configured:
+            self.log.info("Running gitlab-ctl reconfigure (this may take a few minutes)...")
+            self.run_command(["gitlab-ctl", "reconfigure"])
+            state["gitlab_rb"] = rb_hash
+            self._save_state(state)
+            reconfigured = True
+        else:
+            self.log.info("gitlab.rb unchanged — skipping gitlab-ctl reconfigure")
 
         # Apply settings to database — gitlab.rb values are only initial defaults,
         # after first reconfigure the database takes precedence.
-        email_setting = "hard" if require_email else "off"
-        self.log.info("Applying sign-up settings to database...")
-        self.run_command(["gitlab-rails", "runner",
-            "ApplicationSetting.current.update!("
-            "require_admin_approval_after_user_signup: false, "
-            f"email_confirmation_setting: '{email_setting}'"
-            ")"
-        ], check=False)
+        db_settings = {
+            "require_admin_approval_after_user_signup": False,
+            "email_confirmation_setting": "hard" if require_email else "off",
+        }
+        db_hash = hashlib.sha256(json.dumps(db_settings, sort_keys=True).encode()).hexdigest()
+        if db_hash != state.get("db_settings"):
+            self.log.info("Applying sign-up settings to database...")
+            try:
+                self.run_command(["gitlab-rails", "runner",
+                    "ApplicationSetting.current.update!("
+                    "require_admin_approval_after_user_signup: false, "
+                    f"email_confirmation_setting: '{db_settings['email_confirmation_setting']}'"
+                    ")"
+                ])
+            except Exception as e:
+                # Not recorded as applied, so the next reconfigure retries it
+                self.log.warn(f"Applying sign-up settings failed (non-fatal, retried on next reconfigure): {e}")
+            else:
+                state["db_settings"] = db_hash
+                self._save_state(state)
+                if not reconfigured:
+                    # Puma caches application settings per process — reload workers
+                    # gracefully instead of a full reconfigure to pick them up now
+                    self.run_command(["gitlab-ctl", "hup", "puma"], check=False)
+        else:
+            self.log.info("Database settings unchanged — skipping gitlab-rails runner")
+
         self.log.info("GitLab reconfigured successfully")
 
 
@@ -5,7 +5,13 @@ Downloads the Gluetun binary directly from Docker Hub's OCI registry
 LXC container.
 """
 
+import json
 import os
+import random
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from appstore import BaseApp, run
 
@@ -16,6 +22,51 @@ BLOCKED_ENV_KEYS = frozenset({
     "DNS_UPSTREAM_RESOLVER_TYPE", "FIREWALL_OUTBOUND_SUBNETS",
 })
 
+SERVERS_FILE = "/gluetun/servers.json"
+# Node-wide bind mount shared by every Gluetun container on the host
+SERVER_CACHE_DIR = "/mnt/gluetun-cache"
+
+# Latency probe: TCP connect RTT to each candidate (a refused connection
+# still measures the round trip, so closed ports work too)
+PROBE_PORT = 443
+PROBE_TIMEOUT = 1.5
+PROBE_ATTEMPTS = 3
+PROBE_CANDIDATES = 48
+
+
+def _cache_path(provider):
+    return os.path.join(SERVER_CACHE_DIR, provider.replace(" ", "-") + ".json")
+
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _split(value):
+    return {v.strip().lower() for v in value.split(",") if v.strip()}
+
+
+def _tcp_rtt(ip):
+    """Round-trip time of a TCP handshake in ms, or None if unreachable."""
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((ip, PROBE_PORT), timeout=PROBE_TIMEOUT):
+            pass
+    except ConnectionRefusedError:
+        pass
+    except OSError:
+        return None
+    return (time.perf_counter() - start) * 1000
+
+
+def _median_rtt(ip):
+    samples = [rtt for rtt in (_tcp_rtt(ip) for _ in range(PROBE_ATTEMPTS)) if rtt is not None]
+    return statistics.median(samples) if samples else None
+
 
 class GluetunApp(BaseApp):
 
@@ -136,8 +187,18 @@ class GluetunApp(BaseApp):
         self.create_dir("/tmp/gluetun/")
         self.create_dir("/etc/gluetun/")
 
+        # Seed the server list so Gluetun doesn't start from its built-in copy
+        provider = self.inputs.string("vpn_provider", "")
+        self._seed_server_list(provider)
+
         # Build and write environment config
-        self.write_env_file("/etc/gluetun/env", self._build_env(), mode="0600")
+        env = self._build_env()
+        if (self.inputs.boolean("latency_probe", False)
+                and provider != "custom" and "SERVER_HOSTNAMES" not in env):
+            best = self._probe_servers(provider, env)
+            if best:
+                env["SERVER_HOSTNAMES"] = ",".join(best)
+        self.write_env_file("/etc/gluetun/env", env, mode="0600")
 
         # Install start script
         self.deploy_provision_file("start.sh", "/etc/gluetun/start.sh", mode="0755")
@@ -149,23 +210,108 @@ class GluetunApp(BaseApp):
             capabilities=["CAP_NET_ADMIN", "CAP_NET_RAW", "CAP_NET_BIND_SERVICE"],
         )
 
-        # Deploy VPN status page
-        self.status_page(
-            port=self.inputs.integer("status_port", 8001),
-            title="Gluetun",
-            api_url="http://127.0.0.1:8000/v1/publicip/ip",
-            fields={
-                "public_ip": "Public IP",
-                "country": "Country",
-                "region": "Region",
-                "city": "City",
-            },
+        # Status page: serves a snapshot refreshed in the background, so
+        # viewers and scrapers never hit the control server directly
+        self.deploy_provision_file("status.py", "/etc/gluetun/status.py", mode="0755")
+        self.deploy_provision_file("status.html", "/etc/gluetun/status.html")
+        status_port = self.inputs.integer("status_port", 8001)
+        status_interval = self.inputs.integer("status_interval", 10)
+        self.create_service("gluetun-status",
+            exec_start=(f"/usr/bin/python3 /etc/gluetun/status.py"
+                        f" --port {status_port} --interval {status_interval}"),
+            description="Gluetun VPN status page",
+            after="gluetun.service",
+            restart="always",
+            restart_sec=5,
         )
 
         # Wait for VPN to connect
         self.wait_for_http("http://127.0.0.1:8000/v1/publicip/ip", timeout=60)
 
+        # Share the (possibly refreshed) list with later installs on this node
+        self._cache_server_list(provider)
+
         self.log.info("Gluetun VPN client installed successfully")
 
+    def _seed_server_list(self, provider):
+        """Copy the node's cached snapshot for provider into servers.json.
+
+        Gluetun keeps, per provider, whichever of its built-in list and
+        servers.json is newer, so a fresh snapshot saves it a rebuild.
+        """
+        snapshot = _load_json(_cache_path(provider))
+        if not snapshot or not snapshot.get("servers"):
+            self.log.info(f"No cached server list for {provider} on this node")
+            return
+        servers = _load_json(SERVERS_FILE) or {"version": 1}
+        current = servers.get(provider, {})
+        if current.get("timestamp", 0) >= snapshot.get("timestamp", 0):
+            return
+        servers[provider] = snapshot
+        self.write_config(SERVERS_FILE, json.dumps(servers))
+        self.log.info(f"Seeded {len(snapshot['servers'])} {provider} servers from node cache")
+
+    def _cache_server_list(self, provider):
+        """Store Gluetun's current list for provider in the node cache."""
+        if not os.path.isdir(SERVER_CACHE_DIR):
+            return
+        section = (_load_json(SERVERS_FILE) or {}).get(provider)
+        if not section or not section.get("servers"):
+            return
+        cached = _load_json(_cache_path(provider)) or {}
+        if section.get("timestamp", 0) > cached.get("timestamp", 0):
+            self.write_config(_cache_path(provider), json.dumps(section))
+            self.log.info(f"Updated node server cache for {provider}")
+
+    def _probe_servers(self, provider, env):
+        """Rank servers matching the selection by latency; return best hostnames."""
+        section = (_load_json(SERVERS_FILE) or {}).get(provider)
+        if not section:
+            # Nothing cached yet — fetch the list now (the tunnel and its
+            # firewall are not up, so this goes out directly)
+            self.log.info(f"Fetching {provider} server list for latency probe...")
+            self.run_command(["/gluetun-entrypoint", "update", "-enduser",
+                              "-providers", provider], check=False)
+            section = (_load_json(SERVERS_FILE) or {}).get(provider)
+        if not section:
+            self.log.warn("No server list available, skipping latency probe")
+            return []
+
+        vpn_type = env.get("VPN_TYPE", "")
+        filters = [
+            ("country", _split(env.get("SERVER_COUNTRIES", ""))),
+            ("region", _split(env.get("SERVER_REGIONS", ""))),
+            ("city", _split(env.get("SERVER_CITIES", ""))),
+        ]
+        candidates = {}
+        for server in section.get("servers", []):
+            if server.get("vpn", vpn_type) != vpn_type:
+                continue
+            if any(wanted and server.get(field, "").lower() not in wanted
+                   for field, wanted in filters):
+                continue
+            if server.get("hostname") and server.get("ips"):
+                candidates.setdefault(server["hostname"], server["ips"][0])
+        if not candidates:
+            self.log.warn("No servers match the selection, skipping latency probe")
+            return []
+
+        hostnames = list(candidates)
+        if len(hostnames) > PROBE_CANDIDATES:
+            hostnames = random.sample(hostnames, PROBE_CANDIDATES)
+        self.log.info(f"Probing latency of {len(hostnames)} of {len(candidates)} candidate servers...")
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            rtts = dict(zip(hostnames, pool.map(_median_rtt, (candidates[h] for h in hostnames))))
+
+        ranked = sorted((rtt, h) for h, rtt in rtts.items() if rtt is not None)
+        if not ranked:
+            self.log.warn("No candidate server answered, keeping Gluetun's own selection")
+            return []
+        count = max(1, self.inputs.integer("latency_probe_servers", 3))
+        best = [h for _, h in ranked[:count]]
+        for rtt, h in ranked[:count]:
+            self.log.info(f"  {h}: {rtt:.1f} ms")
+        return best
+
 
 run(GluetunApp)
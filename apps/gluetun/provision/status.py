@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Gluetun status page — serves a snapshot refreshed in the background.
+
+Viewers and scrapers only ever read the last snapshot, so polling the page
+never reaches the Gluetun control server or its public IP lookup.
+
+    /              HTML dashboard
+    /status.json   snapshot as JSON
+    /metrics       snapshot in Prometheus text format
+"""
+
+import argparse
+import json
+import subprocess
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTROL = "http://127.0.0.1:8000"
+HTML_PATH = "/etc/gluetun/status.html"
+# Gluetun names the tunnel wg0 (WireGuard) or tun0 (OpenVPN)
+INTERFACES = ("wg0", "tun0")
+# The public IP only changes on reconnect; look it up less often
+PUBLICIP_EVERY = 6
+
+
+def _get_json(path):
+    try:
+        with urllib.request.urlopen(CONTROL + path, timeout=5) as resp:
+            return json.load(resp)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _tunnel_interface():
+    for iface in INTERFACES:
+        if _read_int(f"/sys/class/net/{iface}/ifindex") is not None:
+            return iface
+    return None
+
+
+def _handshake_age(iface):
+    """Seconds since the newest WireGuard handshake, or None."""
+    try:
+        out = subprocess.run(["wg", "show", iface, "latest-handshakes"],
+                             capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    stamps = [int(line.split()[1]) for line in out.splitlines()
+              if len(line.split()) == 2 and line.split()[1].isdigit()]
+    stamps = [s for s in stamps if s > 0]
+    return int(time.time()) - max(stamps) if stamps else None
+
+
+class Collector(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.snapshot = {"vpn_status": "unknown", "updated": None}
+        self.reconnects = 0
+        self.connected_since = None
+        self._seen_up = False
+        self._last_ifindex = None
+        self._last_counters = None
+        self._publicip = {}
+
+    def run(self):
+        cycle = 0
+        while True:
+            try:
+                self.refresh(lookup_ip=cycle % PUBLICIP_EVERY == 0)
+            except Exception as e:  # keep serving the last snapshot
+                print(f"refresh failed: {e}", flush=True)
+            cycle += 1
+            time.sleep(self.interval)
+
+    def refresh(self, lookup_ip):
+        now = time.time()
+        status = (_get_json("/v1/vpn/status") or {}).get("status", "unreachable")
+        iface = _tunnel_interface()
+        ifindex = _read_int(f"/sys/class/net/{iface}/ifindex") if iface else None
+
+        # A new tunnel interface (or a down → up transition) is a reconnect
+        up = status == "running" and ifindex is not None
+        if up and ifindex != self._last_ifindex:
+            if self._seen_up:
+                self.reconnects += 1
+            self._seen_up = True
+            self.connected_since = now
+            self._last_counters = None
+            lookup_ip = True
+        if not up:
+            self.connected_since = None
+        self._last_ifindex = ifindex if up else None
+
+        rx = tx = rx_rate = tx_rate = None
+        if iface:
+            rx = _read_int(f"/sys/class/net/{iface}/statistics/rx_bytes")
+            tx = _read_int(f"/sys/class/net/{iface}/statistics/tx_bytes")
+            if self._last_counters and rx is not None and tx is not None:
+                t0, rx0, tx0 = self._last_counters
+                elapsed = max(now - t0, 1e-3)
+                rx_rate = max(0, rx - rx0) / elapsed
+                tx_rate = max(0, tx - tx0) / elapsed
+            if rx is not None and tx is not None:
+                self._last_counters = (now, rx, tx)
+
+        if lookup_ip and up:
+            self._publicip = _get_json("/v1/publicip/ip") or self._publicip
+        forwarded = (_get_json("/v1/portforward") or {}).get("port") if up else None
+
+        snapshot = {
+            "vpn_status": status,
+            "interface": iface,
+            "public_ip": self._publicip.get("public_ip"),
+            "country": self._publicip.get("country"),
+            "region": self._publicip.get("region"),
+            "city": self._publicip.get("city"),
+            "forwarded_port": forwarded or None,
+            "rx_bytes": rx,
+            "tx_bytes": tx,
+            "rx_bytes_per_sec": round(rx_rate) if rx_rate is not None else None,
+            "tx_bytes_per_sec": round(tx_rate) if tx_rate is not None else None,
+            "handshake_age_seconds": _handshake_age(iface) if iface == "wg0" else None,
+            "connected_seconds": int(now - self.connected_since) if self.connected_since else None,
+            "reconnects": self.reconnects,
+            "updated": int(now),
+            "refresh_interval": self.interval,
+        }
+        with self.lock:
+            self.snapshot = snapshot
+
+    def get(self):
+        with self.lock:
+            return dict(self.snapshot)
+
+
+def metrics(snap):
+    lines = []
+
+    def gauge(name, value, help_text, labels="", kind="gauge"):
+        if value is None:
+            return
+        lines.append(f"# HELP gluetun_{name} {help_text}")
+        lines.append(f"# TYPE gluetun_{name} {kind}")
+        lines.append(f"gluetun_{name}{labels} {value}")
+
+    info = ",".join(f'{k}="{snap.get(k) or ""}"' for k in ("public_ip", "country", "region", "city"))
+    gauge("vpn_up", 1 if snap.get("vpn_status") == "running" else 0, "1 if the VPN tunnel is running")
+    gauge("info", 1, "Public IP and location of the tunnel exit", "{" + info + "}")
+    gauge("rx_bytes_total", snap.get("rx_bytes"), "Bytes received on the tunnel interface", kind="counter")
+    gauge("tx_bytes_total", snap.get("tx_bytes"), "Bytes sent on the tunnel interface", kind="counter")
+    gauge("rx_bytes_per_second", snap.get("rx_bytes_per_sec"), "Receive rate over the last interval")
+    gauge("tx_bytes_per_second", snap.get("tx_bytes_per_sec"), "Send rate over the last interval")
+    gauge("handshake_age_seconds", snap.get("handshake_age_seconds"), "Seconds since the last WireGuard handshake")
+    gauge("connected_seconds", snap.get("connected_seconds"), "Seconds since the tunnel came up")
+    gauge("reconnects_total", snap.get("reconnects"), "Tunnel reconnects since the status service started",
+          kind="counter")
+    gauge("forwarded_port", snap.get("forwarded_port"), "Port forwarded by the VPN provider")
+    gauge("snapshot_timestamp_seconds", snap.get("updated"), "Time of the last refresh")
+    return "\n".join(lines) + "\n"
+
+
+def make_handler(collector, html):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/":
+                self._send(200, "text/html; charset=utf-8", html)
+            elif path == "/status.json":
+                self._send(200, "application/json", json.dumps(collector.get()).encode())
+            elif path == "/metrics":
+                self._send(200, "text/plain; version=0.0.4", metrics(collector.get()).encode())
+            else:
+                self._send(404, "text/plain", b"not found\n")
+
+        def _send(self, code, ctype, body):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--interval", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(HTML_PATH, "rb") as f:
+        html = f.read()
+    collector = Collector(max(1, args.interval))
+    collector.start()
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(collector, html))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
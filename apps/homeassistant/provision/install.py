@@ -1,7 +1,29 @@
 """Home Assistant — open source home automation."""
 
+import glob
+
 from appstore import BaseApp, run
 
+VENV = "/opt/homeassistant/venv"
+DB_NAME = "homeassistant"
+MARIADB_SOCKET = "/run/mysqld/mysqld.sock"
+
+
+def _container_memory_mb():
+    """Memory available to this container (cgroup v2 limit, then /proc/meminfo)."""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            return int(limit) // (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    return 0
+
 
 class HomeAssistantApp(BaseApp):
     def install(self):
@@ -9,6 +31,7 @@ class HomeAssistantApp(BaseApp):
         http_port = self.inputs.integer("http_port", 8123)
         config_path = self.inputs.string("config_path", "/opt/homeassistant/config")
         enable_mqtt = self.inputs.boolean("enable_mqtt", False)
+        recorder_db = self.inputs.string("recorder_db", "sqlite")
 
         # Install system dependencies
         self.apt_install(
@@ -28,14 +51,22 @@ class HomeAssistantApp(BaseApp):
         self.create_dir(config_path)
 
         # Install Home Assistant in a venv
-        self.create_venv("/opt/homeassistant/venv")
-        self.pip_install("homeassistant", venv="/opt/homeassistant/venv")
+        self.create_venv(VENV)
+        self.pip_install("homeassistant", venv=VENV)
+
+        # Local recorder database, if requested
+        db_url = ""
+        if recorder_db == "mariadb":
+            db_url = self._setup_mariadb()
+        elif recorder_db == "postgresql":
+            db_url = self._setup_postgresql()
 
         # Write Home Assistant configuration
         self.render_template("configuration.yaml", f"{config_path}/configuration.yaml",
             timezone=timezone,
             http_port=http_port,
         )
+        self._write_recorder_config(config_path, db_url)
 
         # Install MQTT broker if requested
         if enable_mqtt:
@@ -47,14 +78,20 @@ class HomeAssistantApp(BaseApp):
                 f.write(mqtt_snippet)
             self.log.info("MQTT broker installed and running on port 1883")
 
+        # Pre-compile bytecode so the first hass start doesn't pay for it
+        self.run_command([f"{VENV}/bin/python", "-m", "compileall", "-q", "-j", "0",
+                          f"{VENV}/lib"], check=False)
+
         # Set ownership
         self.chown("/opt/homeassistant", "homeassistant:homeassistant", recursive=True)
         self.chown(config_path, "homeassistant:homeassistant", recursive=True)
 
         # Create systemd service
         self.create_service("homeassistant",
-            exec_start=f"/opt/homeassistant/venv/bin/hass -c {config_path}",
+            exec_start=f"{VENV}/bin/hass -c {config_path}",
             description="Home Assistant Core",
+            after={"mariadb": "mariadb.service",
+                   "postgresql": "postgresql.service"}.get(recorder_db, "network.target"),
             user="homeassistant",
             working_directory="/opt/homeassistant",
             environment={"PATH": "/opt/homeassistant/venv/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"},
@@ -63,5 +100,68 @@ class HomeAssistantApp(BaseApp):
         )
         self.log.info("Home Assistant installed successfully")
 
+    def _write_recorder_config(self, config_path, db_url):
+        """Render recorder.yaml, included from configuration.yaml."""
+        commit_interval = self.inputs.integer("recorder_commit_interval", 5)
+        purge_keep_days = self.inputs.integer("recorder_purge_keep_days", 10)
+        exclude = [d.strip() for d in
+                   self.inputs.string("recorder_exclude_domains", "").split(",")
+                   if d.strip()]
+
+        self.render_template("recorder.yaml", f"{config_path}/recorder.yaml",
+            db_url_line=f'db_url: "{db_url}"' if db_url else "",
+            commit_interval=commit_interval,
+            purge_keep_days=purge_keep_days,
+            exclude=bool(exclude),
+            exclude_domains="\n".join(f"    - {d}" for d in exclude),
+        )
+
+    def _setup_mariadb(self):
+        """Install MariaDB tuned for the recorder; HA connects over the socket."""
+        # mysqlclient is built from source against the venv's Python headers
+        self.apt_install("mariadb-server", "libmariadb-dev", "pkg-config", "python3-dev")
+        memory_mb = _container_memory_mb()
+        self.render_template("mariadb.cnf", "/etc/mysql/mariadb.conf.d/60-homeassistant.cnf",
+            buffer_pool=f"{max(128, memory_mb // 4)}M",
+        )
+        self.enable_service("mariadb")
+        self.restart_service("mariadb")
+
+        # unix_socket auth: the homeassistant OS user needs no password
+        self.run_command(["mysql"], input_text=(
+            f"CREATE DATABASE IF NOT EXISTS {DB_NAME} "
+            "CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;\n"
+            "CREATE USER IF NOT EXISTS 'homeassistant'@'localhost' IDENTIFIED VIA unix_socket;\n"
+            f"GRANT ALL PRIVILEGES ON {DB_NAME}.* TO 'homeassistant'@'localhost';\n"
+        ))
+        self.pip_install("mysqlclient", venv=VENV)
+        self.log.info("Recorder database: local MariaDB")
+        return (f"mysql://homeassistant@localhost/{DB_NAME}"
+                f"?unix_socket={MARIADB_SOCKET}&charset=utf8mb4")
+
+    def _setup_postgresql(self):
+        """Install PostgreSQL tuned for the recorder; HA connects with peer auth."""
+        self.apt_install("postgresql")
+        memory_mb = _container_memory_mb()
+        conf_dir = sorted(glob.glob("/etc/postgresql/*/main"))[-1]
+        self.render_template("postgresql.conf", f"{conf_dir}/conf.d/homeassistant.conf",
+            shared_buffers=f"{max(128, memory_mb // 4)}MB",
+            effective_cache_size=f"{max(256, memory_mb // 2)}MB",
+        )
+        self.enable_service("postgresql")
+        self.restart_service("postgresql")
+
+        self.run_command(["runuser", "-u", "postgres", "--", "psql", "-v", "ON_ERROR_STOP=1"],
+            input_text=(
+                "SELECT 'CREATE ROLE homeassistant LOGIN' WHERE NOT EXISTS "
+                "(SELECT FROM pg_roles WHERE rolname = 'homeassistant')\\gexec\n"
+                f"SELECT 'CREATE DATABASE {DB_NAME} OWNER homeassistant' WHERE NOT EXISTS "
+                f"(SELECT FROM pg_database WHERE datname = '{DB_NAME}')\\gexec\n"
+            ),
+        )
+        self.pip_install("psycopg2-binary", venv=VENV)
+        self.log.info("Recorder database: local PostgreSQL")
+        return f"postgresql://@/{DB_NAME}"
+
 
 run(HomeAssistantApp)
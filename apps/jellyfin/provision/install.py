@@ -1,15 +1,41 @@
 """Jellyfin — free software media system."""
 
+import os
+import pwd
+import xml.etree.ElementTree as ET
+
 from appstore import BaseApp, run
 
+CONFIG_DIR = "/etc/jellyfin"
+ENCODING_XML = f"{CONFIG_DIR}/encoding.xml"
+CACHE_PATH = "/var/cache/jellyfin"  # Set by bind mount in manifest
+TRANSCODE_PATH = f"{CACHE_PATH}/transcodes"
+TMPFS_UNIT = "var-cache-jellyfin-transcodes.mount"
+
+# hw_accel input -> Jellyfin HardwareAccelerationType
+HW_ACCEL_TYPES = {"none": "none", "qsv": "vaapi", "nvenc": "nvenc"}
+
+
+def _container_memory_mb():
+    """Memory available to this container (cgroup v2 limit, then /proc/meminfo)."""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            return int(limit) // (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    return 0
+
 
 class JellyfinApp(BaseApp):
     def install(self):
         http_port = self.inputs.integer("http_port", 8096)
         media_path = "/mnt/media"  # Set by bind mount in manifest
-        cache_path = "/var/cache/jellyfin"  # Set by bind mount in manifest
-        transcode_threads = self.inputs.integer("transcode_threads", 0)
-        hw_accel = self.inputs.string("hw_accel", "none")
 
         # Install system dependencies
         self.apt_install("curl", "gnupg")
@@ -19,33 +45,118 @@ class JellyfinApp(BaseApp):
 
         # Create media and cache directories
         self.create_dir(media_path)
-        self.create_dir(cache_path, owner="jellyfin:jellyfin")
+        self.create_dir(CACHE_PATH, owner="jellyfin:jellyfin")
 
         # Jellyfin config directory
-        config_dir = "/etc/jellyfin"
-        self.create_dir(config_dir)
+        self.create_dir(CONFIG_DIR)
 
         # Configure custom port if non-default
         if http_port != 8096:
-            self.render_template("network.xml", f"{config_dir}/network.xml",
+            self.render_template("network.xml", f"{CONFIG_DIR}/network.xml",
                 http_port=http_port,
             )
-            self.chown(f"{config_dir}/network.xml", "jellyfin:jellyfin")
+            self.chown(f"{CONFIG_DIR}/network.xml", "jellyfin:jellyfin")
+
+        # Transcoding settings and hardware acceleration
+        self.configure()
+
+        self.enable_service("jellyfin")
+        self.log.info("Jellyfin installed successfully")
+
+    def configure(self):
+        """Apply transcoding settings to encoding.xml. Called by install() and reconfigure."""
+        transcode_threads = self.inputs.integer("transcode_threads", 0)
+        hw_accel = self.inputs.string("hw_accel", "none")
+        throttling = self.inputs.boolean("transcode_throttling", True)
+        segment_deletion = self.inputs.boolean("segment_deletion", True)
+        tmpfs = self.inputs.boolean("transcode_tmpfs", False)
+        tmpfs_mb = self.inputs.integer("transcode_tmpfs_mb", 0)
+
+        self.create_dir(TRANSCODE_PATH, owner="jellyfin:jellyfin")
+        self._configure_transcode_tmpfs(tmpfs, tmpfs_mb)
+
+        settings = {
+            # Jellyfin uses -1 for automatic thread selection
+            "EncodingThreadCount": transcode_threads if transcode_threads > 0 else -1,
+            "TranscodingTempPath": TRANSCODE_PATH,
+            "EnableThrottling": throttling,
+            "EnableSegmentDeletion": segment_deletion,
+            "HardwareAccelerationType": HW_ACCEL_TYPES.get(hw_accel, "none"),
+            "EnableHardwareEncoding": hw_accel != "none",
+        }
 
         # Configure hardware acceleration
         if hw_accel == "qsv":
-            self.deploy_provision_file("encoding-qsv.xml", f"{config_dir}/encoding.xml")
-            self.chown(f"{config_dir}/encoding.xml", "jellyfin:jellyfin")
+            settings["VaapiDevice"] = "/dev/dri/renderD128"
             self.run_command(["usermod", "-aG", "render", "jellyfin"])
             self.run_command(["usermod", "-aG", "video", "jellyfin"])
             self.log.info("Intel QSV hardware acceleration configured")
         elif hw_accel == "nvenc":
-            self.deploy_provision_file("encoding-nvenc.xml", f"{config_dir}/encoding.xml")
-            self.chown(f"{config_dir}/encoding.xml", "jellyfin:jellyfin")
             self.log.info("NVIDIA NVENC hardware acceleration configured")
 
-        self.enable_service("jellyfin")
-        self.log.info("Jellyfin installed successfully")
+        self._merge_encoding(settings)
+        self.log.info(
+            f"Transcoding: threads={settings['EncodingThreadCount']}, throttling={throttling}, "
+            f"segment deletion={segment_deletion}, tmpfs={tmpfs}"
+        )
+
+        # Restart service to pick up new config (no-op on first install)
+        self.restart_service("jellyfin")
+
+    def _merge_encoding(self, settings):
+        """Set keys in encoding.xml, keeping everything else Jellyfin has written there."""
+        try:
+            root = ET.parse(ENCODING_XML).getroot()
+        except (FileNotFoundError, ET.ParseError):
+            root = ET.fromstring(self.provision_file("encoding.xml").encode())
+
+        for key, value in settings.items():
+            elem = root.find(key)
+            if elem is None:
+                elem = ET.SubElement(root, key)
+            elem.text = str(value).lower() if isinstance(value, bool) else str(value)
+
+        ET.indent(root)
+        xml = '<?xml version="1.0" encoding="utf-8"?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+        # Escape $ so values Jellyfin wrote are kept verbatim, not substituted
+        self.write_config(ENCODING_XML, xml.replace("$", "$$"))
+        self.chown(ENCODING_XML, "jellyfin:jellyfin")
+
+    def _configure_transcode_tmpfs(self, enabled, size_mb):
+        """Mount (or unmount) a tmpfs over the transcode directory.
+
+        Segments are written and deleted constantly while streaming; keeping them
+        in RAM removes that disk I/O. The tmpfs counts against the container's
+        memory limit, so it defaults to a quarter of it.
+        """
+        unit_path = f"/etc/systemd/system/{TMPFS_UNIT}"
+        if not enabled:
+            if os.path.exists(unit_path):
+                self.run_command(["systemctl", "disable", "--now", TMPFS_UNIT], check=False)
+                self.run_command(["rm", "-f", unit_path])
+                self.run_command(["systemctl", "daemon-reload"])
+                self.log.info("RAM-backed transcode directory removed")
+            return
+
+        memory_mb = _container_memory_mb()
+        if size_mb <= 0:
+            size_mb = max(512, memory_mb // 4)
+        if memory_mb and size_mb > memory_mb // 2:
+            self.log.warn(f"Transcode tmpfs of {size_mb} MB is over half of the container's "
+                          f"{memory_mb} MB — Jellyfin may be OOM-killed under load")
+
+        user = pwd.getpwnam("jellyfin")
+        self.render_template("transcode-tmpfs.mount", unit_path,
+            transcode_path=TRANSCODE_PATH,
+            size=f"{size_mb}m",
+            uid=user.pw_uid,
+            gid=user.pw_gid,
+        )
+        self.run_command(["systemctl", "daemon-reload"])
+        # Reload remounts in place, so a size change applies without unmounting
+        self.run_command(["systemctl", "enable", "--now", TMPFS_UNIT])
+        self.run_command(["systemctl", "reload", TMPFS_UNIT])
+        self.log.info(f"Transcode directory {TRANSCODE_PATH} is RAM-backed ({size_mb} MB tmpfs)")
 
 
 run(JellyfinApp)
@@ -2,31 +2,67 @@
 
 from appstore import BaseApp, run
 
+# key_type input → openssl req arguments
+OPENSSL_KEY_ARGS = {
+    "ecdsa-p256": ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1"],
+    "ecdsa-p384": ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:secp384r1"],
+    "rsa-2048":   ["-newkey", "rsa:2048"],
+    "rsa-4096":   ["-newkey", "rsa:4096"],
+}
+
 
 class NginxApp(BaseApp):
     def install(self):
-        self.apt_install("nginx")
-
         domain = self.inputs.string("domain", "")
         enable_ssl = self.inputs.boolean("enable_ssl", False)
         http_port = self.inputs.integer("http_port", 80)
         https_port = self.inputs.integer("https_port", 443)
+        key_type = self.inputs.string("key_type", "ecdsa-p256")
         worker_processes = self.inputs.integer("worker_processes", 0)
+        worker_connections = self.inputs.integer("worker_connections", 4096)
+        keepalive_timeout = self.inputs.integer("keepalive_timeout", 65)
+        keepalive_requests = self.inputs.integer("keepalive_requests", 1000)
+        compression_level = self.inputs.integer("compression_level", 5)
+        brotli = self.inputs.boolean("brotli", False)
+        open_file_cache = self.inputs.integer("open_file_cache", 10000)
+        ssl_session_cache_mb = self.inputs.integer("ssl_session_cache_mb", 10)
+
+        self.apt_install("nginx")
+
+        if brotli and compression_level > 0:
+            # Brotli modules are not in every Debian release's archive
+            try:
+                self.apt_install("libnginx-mod-http-brotli-filter", "libnginx-mod-http-brotli-static")
+            except Exception as e:
+                self.log.warn(f"Brotli modules unavailable, using gzip only: {e}")
+                brotli = False
 
         server_name_line = f"server_name {domain};" if domain else ""
 
-        # Configure worker processes
-        if worker_processes != 0:
-            self.run_command([
-                "sed", "-i",
-                f"s/worker_processes auto;/worker_processes {worker_processes};/",
-                "/etc/nginx/nginx.conf",
-            ])
+        # Main config — full template instead of editing the distro file
+        self.render_template("nginx.conf", "/etc/nginx/nginx.conf",
+            worker_processes=worker_processes or "auto",
+            # Each connection may hold a client and an upstream descriptor
+            worker_rlimit_nofile=worker_connections * 2,
+            worker_connections=worker_connections,
+            keepalive_timeout=keepalive_timeout,
+            keepalive_requests=keepalive_requests,
+            open_file_cache_enabled=open_file_cache > 0,
+            open_file_cache=open_file_cache,
+            gzip=compression_level > 0,
+            brotli=brotli and compression_level > 0,
+            compression_level=min(compression_level, 9),
+        )
 
-        # Write default server block
-        self.render_template("server.conf", "/etc/nginx/sites-available/default",
+        # Default server block, plus HTTPS server block if requested
+        site = self.provision_file("server.conf")
+        if enable_ssl:
+            site += self.provision_file("ssl.conf")
+        self.write_config("/etc/nginx/sites-available/default", site,
             http_port=http_port,
+            https_port=https_port,
             server_name_line=server_name_line,
+            ssl_session_cache=f"{ssl_session_cache_mb}m",
         )
 
         # Generate self-signed SSL if requested
@@ -35,20 +71,15 @@ class NginxApp(BaseApp):
             cn = domain if domain else "localhost"
             self.run_command([
                 "openssl", "req", "-x509", "-nodes", "-days", "365",
-                "-newkey", "rsa:2048",
+                *OPENSSL_KEY_ARGS.get(key_type, OPENSSL_KEY_ARGS["ecdsa-p256"]),
                 "-keyout", "/etc/nginx/ssl/nginx.key",
                 "-out", "/etc/nginx/ssl/nginx.crt",
                 "-subj", f"/CN={cn}",
             ])
 
-            # Append SSL server block
-            ssl_content = self.provision_file("ssl.conf")
-            ssl_content = ssl_content.replace("$https_port", str(https_port))
-            ssl_content = ssl_content.replace("$server_name_line", server_name_line)
-            with open("/etc/nginx/sites-available/default", "a") as f:
-                f.write(ssl_content)
-
+        self.run_command(["nginx", "-t"])
         self.enable_service("nginx")
+        self.restart_service("nginx")
         self.log.info("Nginx installed successfully")
 
 
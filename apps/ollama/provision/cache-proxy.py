@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""Caching proxy in front of the Ollama API.
+
+Serves the Ollama API on its own port and answers repeat work from a disk
+cache:
+
+    /api/embed         cached per input; concurrent requests for the same
+                       model are merged into one upstream call
+    /api/embeddings    cached per request
+    /api/generate,     cached per request when options.temperature is 0,
+    /api/chat          streamed or not (the stream is teed into the cache)
+
+Cache keys are the model's digest from /api/tags plus the normalized request,
+so re-pulling a model under the same name never serves stale answers. Entries
+live under CACHE_DIR in a byte-bounded LRU that survives restarts. Everything
+else is passed through unchanged.
+
+    /metrics        hit/miss counters in Prometheus text format
+    /cache/stats    the same as JSON
+    DELETE /cache   drop every entry
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+UPSTREAM = urlsplit(os.environ.get("OLLAMA_CACHE_UPSTREAM", "http://127.0.0.1:11434"))
+LISTEN = os.environ.get("OLLAMA_CACHE_HOST", "0.0.0.0")
+PORT = int(os.environ.get("OLLAMA_CACHE_PORT", "11435"))
+CACHE_DIR = os.environ.get("OLLAMA_CACHE_DIR", "/var/lib/ollama-cache")
+MAX_BYTES = int(os.environ.get("OLLAMA_CACHE_SIZE_MB", "1024")) * 1024 * 1024
+BATCH_WINDOW = int(os.environ.get("OLLAMA_CACHE_BATCH_MS", "5")) / 1000
+BATCH_MAX_INPUTS = 256
+# One entry may take at most this share of the cache
+MAX_ENTRY = MAX_BYTES // 8
+# Model digests are re-read from /api/tags this often
+DIGEST_TTL = 30
+# Request fields that do not change the answer
+UNKEYED_FIELDS = ("keep_alive",)
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade",
+               "proxy-authorization", "proxy-authenticate", "content-length", "host"}
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def inc(self, name, endpoint, value=1):
+        with self.lock:
+            key = (name, endpoint)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+METRICS = Metrics()
+
+
+class DiskLRU:
+    """Files under CACHE_DIR/<2 hex>/<key>, evicted least recently used first.
+
+    The in-memory index holds only key -> size; access times on disk keep
+    the order across restarts.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = OrderedDict()
+        self.total = 0
+        entries = []
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                if name.endswith(".tmp"):
+                    os.remove(path)
+                    continue
+                st = os.stat(path)
+                entries.append((max(st.st_atime, st.st_mtime), name, st.st_size))
+        for _, key, size in sorted(entries):
+            self.index[key] = size
+            self.total += size
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.index:
+                return None
+            self.index.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            with self.lock:
+                self.total -= self.index.pop(key, 0)
+            return None
+
+    def put(self, key, data):
+        if len(data) > MAX_ENTRY:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            self.total += len(data) - self.index.pop(key, 0)
+            self.index[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.total > self.max_bytes and self.index:
+            key, size = self.index.popitem(last=False)
+            self.total -= size
+            METRICS.inc("evictions", "cache")
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            keys = list(self.index)
+            self.index.clear()
+            self.total = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.index), "bytes": self.total, "max_bytes": self.max_bytes}
+
+
+CACHE = None
+
+
+def upstream(method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(UPSTREAM.hostname, UPSTREAM.port or 80, timeout=600)
+    conn.request(method, path, body=body, headers=headers or {})
+    return conn, conn.getresponse()
+
+
+def upstream_json(path, payload):
+    """POST payload upstream; returns (status, body bytes)."""
+    conn, resp = upstream("POST", path, json.dumps(payload).encode(),
+                          {"Content-Type": "application/json"})
+    try:
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+class Digests:
+    """Model name -> digest, from /api/tags."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.digests = {}
+        self.fetched = 0.0
+        self.refreshing = False
+
+    def _fetch(self):
+        conn, resp = upstream("GET", "/api/tags")
+        try:
+            models = json.loads(resp.read()).get("models", [])
+        finally:
+            conn.close()
+        return {m["name"]: m["digest"] for m in models if m.get("digest")}
+
+    def get(self, model):
+        if not model:
+            return None
+        name = model if ":" in model else f"{model}:latest"
+        with self.lock:
+            age = time.monotonic() - self.fetched
+            # A name not seen yet may have just been pulled; re-check, but not per request
+            stale = age > DIGEST_TTL or (name not in self.digests and age > 2)
+            refresh = stale and not self.refreshing
+            if refresh:
+                self.refreshing = True
+        if refresh:
+            # One thread fetches, outside the lock; the others keep using the
+            # current table meanwhile
+            try:
+                digests = self._fetch()
+            except (OSError, ValueError):
+                digests = None
+            with self.lock:
+                if digests is not None:
+                    self.digests = digests
+                    self.fetched = time.monotonic()
+                self.refreshing = False
+        return self.digests.get(name)
+
+
+DIGESTS = Digests()
+
+
+def cache_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _keyed(body):
+    return {k: v for k, v in body.items() if k not in UNKEYED_FIELDS}
+
+
+class _Batch:
+    def __init__(self):
+        self.inputs = {}  # ordered set
+        self.closed = False
+        self.done = threading.Event()
+        self.results = {}
+        self.error = None
+
+
+class EmbedBatcher:
+    """Merges /api/embed misses that arrive within BATCH_WINDOW into one call.
+
+    The first request for a (model, options) group leads: it waits out the
+    window, sends every queued input in a single request and hands each
+    follower its vectors.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = {}
+
+    def embed(self, group, params, inputs):
+        with self.lock:
+            batch = self.open.get(group)
+            leader = batch is None or batch.closed or len(batch.inputs) >= BATCH_MAX_INPUTS
+            if leader:
+                batch = self.open[group] = _Batch()
+            batch.inputs.update(dict.fromkeys(inputs))
+        if leader:
+            time.sleep(BATCH_WINDOW)
+            with self.lock:
+                batch.closed = True
+                if self.open.get(group) is batch:
+                    del self.open[group]
+            self._run(batch, params)
+        else:
+            batch.done.wait()
+        if batch.error:
+            raise UpstreamError(*batch.error)
+        return [batch.results[text] for text in inputs]
+
+    def _run(self, batch, params):
+        started = time.perf_counter()
+        try:
+            status, raw = upstream_json("/api/embed", {**params, "input": list(batch.inputs)})
+            if status != 200:
+                batch.error = (status, raw)
+            else:
+                vectors = json.loads(raw)["embeddings"]
+                batch.results = dict(zip(batch.inputs, vectors))
+                METRICS.inc("batches", "/api/embed")
+                METRICS.inc("batched_inputs", "/api/embed", len(batch.inputs))
+                METRICS.inc("upstream_seconds", "/api/embed", time.perf_counter() - started)
+        except (OSError, ValueError, KeyError) as e:
+            batch.error = (502, json.dumps({"error": f"upstream: {e}"}).encode())
+        finally:
+            batch.done.set()
+
+
+class UpstreamError(Exception):
+    def __init__(self, status, body):
+        super().__init__(status)
+        self.status = status
+        self.body = body
+
+
+BATCHER = EmbedBatcher()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    # --- responses -------------------------------------------------------
+
+    def _send(self, status, body, ctype="application/json", extra=None):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, status, headers):
+        self.send_response(status)
+        for name, value in headers:
+            if name.lower() not in HOP_HEADERS:
+                self.send_header(name, value)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data):
+        if data:
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    # --- routing ---------------------------------------------------------
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._send(200, metrics_text().encode(), "text/plain; version=0.0.4")
+        elif path == "/cache/stats":
+            self._send(200, json.dumps(stats()).encode())
+        else:
+            self._proxy("GET")
+
+    def do_HEAD(self):
+        self._proxy("HEAD")
+
+    def do_DELETE(self):
+        if self.path.split("?", 1)[0] == "/cache":
+            CACHE.clear()
+            self._send(200, b'{"status":"cleared"}')
+        else:
+            self._proxy("DELETE")
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        try:
+            body = json.loads(raw) if path in CACHED_PATHS else None
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            return self._proxy("POST", raw)
+
+        digest = DIGESTS.get(body.get("model"))
+        if digest is None:
+            # Unknown model: let Ollama answer (or pull it) and cache nothing
+            METRICS.inc("uncacheable", path)
+            return self._proxy("POST", raw)
+        try:
+            if path == "/api/embed":
+                self._embed(body, digest)
+            elif path == "/api/embeddings":
+                self._cached_response(path, body, digest, raw)
+            elif (body.get("options") or {}).get("temperature") == 0:
+                self._cached_response(path, body, digest, raw)
+            else:
+                METRICS.inc("uncacheable", path)
+                self._proxy("POST", raw)
+        except UpstreamError as e:
+            self._send(e.status, e.body)
+
+    # --- cached endpoints --------------------------------------------------
+
+    def _embed(self, body, digest):
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        if not all(isinstance(text, str) for text in inputs):
+            return self._proxy("POST", json.dumps(body).encode())
+        params = {k: v for k, v in _keyed(body).items() if k != "input"}
+        group = cache_key(digest, params)
+
+        vectors, missing = {}, []
+        for text in inputs:
+            hit = CACHE.get(cache_key(group, text))
+            if hit is not None:
+                vectors[text] = json.loads(hit)
+            elif text not in missing:
+                missing.append(text)
+        METRICS.inc("hits", "/api/embed", len(inputs) - len(missing))
+        METRICS.inc("misses", "/api/embed", len(missing))
+
+        if missing:
+            params["keep_alive"] = body.get("keep_alive")
+            params = {k: v for k, v in params.items() if v is not None}
+            for text, vector in zip(missing, BATCHER.embed(group, params, missing)):
+                vectors[text] = vector
+                CACHE.put(cache_key(group, text), json.dumps(vector, separators=(",", ":")).encode())
+
+        reply = {"model": body["model"], "embeddings": [vectors[text] for text in inputs]}
+        self._send(200, json.dumps(reply).encode(), extra={"X-Cache": "MISS" if missing else "HIT"})
+
+    def _cached_response(self, path, body, digest, raw):
+        """Serve /api/embeddings, /api/generate or /api/chat from the cache,
+        or forward it and store the answer. Streams are replayed as streams."""
+        keyed = _keyed(body)
+        keyed["stream"] = body.get("stream", path != "/api/embeddings")
+        key = cache_key(path, digest, keyed)
+        hit = CACHE.get(key)
+        if hit is not None:
+            meta, _, payload = hit.partition(b"\n")
+            meta = json.loads(meta)
+            METRICS.inc("hits", path)
+            METRICS.inc("saved_seconds", path, meta.get("elapsed", 0))
+            if meta.get("chunked"):
+                self._start_chunked(200, [("Content-Type", meta["ctype"]), ("X-Cache", "HIT")])
+                for line in payload.splitlines(keepends=True):
+                    self._chunk(line)
+                self._end_chunked()
+            else:
+                self._send(200, payload, meta["ctype"], {"X-Cache": "HIT"})
+            return
+
+        METRICS.inc("misses", path)
+        started = time.perf_counter()
+        try:
+            conn, resp = upstream("POST", path, raw, {"Content-Type": "application/json"})
+        except OSError as e:
+            raise UpstreamError(502, json.dumps({"error": f"upstream: {e}"}).encode())
+        streaming = False
+        try:
+            ctype = resp.getheader("Content-Type", "application/json")
+            chunked = resp.getheader("Content-Length") is None
+            if chunked:
+                # Tee the stream: the client gets each line as it arrives
+                self._start_chunked(resp.status, resp.getheaders() + [("X-Cache", "MISS")])
+                streaming = True
+                parts, size = [], 0
+                while True:
+                    data = resp.read1(65536)
+                    if not data:
+                        break
+                    self._chunk(data)
+                    if size <= MAX_ENTRY:
+                        parts.append(data)
+                        size += len(data)
+                self._end_chunked()
+                payload = b"".join(parts)
+            else:
+                payload = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            if not streaming:
+                raise UpstreamError(502, json.dumps({"error": f"upstream: {e}"}).encode())
+            # Headers are out: drop the connection so the client sees a cut stream
+            self.close_connection = True
+            return
+        finally:
+            conn.close()
+        if not chunked:
+            self._send(resp.status, payload, ctype, {"X-Cache": "MISS"})
+
+        elapsed = time.perf_counter() - started
+        METRICS.inc("upstream_seconds", path, elapsed)
+        if resp.status == 200 and size_ok(payload) and _complete(payload, chunked):
+            meta = json.dumps({"ctype": ctype, "chunked": chunked, "elapsed": round(elapsed, 6)})
+            CACHE.put(key, meta.encode() + b"\n" + payload)
+
+    # --- pass-through ------------------------------------------------------
+
+    def _proxy(self, method, body=None):
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+        if body is None and self.headers.get("Content-Length"):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        try:
+            conn, resp = upstream(method, self.path, body, headers)
+        except OSError as e:
+            return self._send(502, json.dumps({"error": f"upstream: {e}"}).encode())
+        try:
+            length = resp.getheader("Content-Length")
+            if length is not None or method == "HEAD":
+                data = resp.read()
+                self.send_response(resp.status)
+                for name, value in resp.getheaders():
+                    if name.lower() not in HOP_HEADERS:
+                        self.send_header(name, value)
+                self.send_header("Content-Length", length or str(len(data)))
+                self.end_headers()
+                if method != "HEAD":
+                    self.wfile.write(data)
+            else:
+                self._start_chunked(resp.status, resp.getheaders())
+                while True:
+                    data = resp.read1(65536)
+                    if not data:
+                        break
+                    self._chunk(data)
+                self._end_chunked()
+        finally:
+            conn.close()
+
+
+CACHED_PATHS = ("/api/embed", "/api/embeddings", "/api/generate", "/api/chat")
+
+
+def size_ok(payload):
+    return 0 < len(payload) <= MAX_ENTRY
+
+
+def _complete(payload, chunked):
+    """Only cache answers that finished. A stream cut short ends on a
+    "done": false line; errors arrive as an "error" object."""
+    if not chunked:
+        return True
+    try:
+        last = json.loads(payload.rstrip().rsplit(b"\n", 1)[-1])
+    except ValueError:
+        return False
+    return isinstance(last, dict) and "error" not in last and last.get("done", True) is True
+
+
+def stats():
+    counters = {}
+    for (name, endpoint), value in METRICS.snapshot().items():
+        counters.setdefault(endpoint, {})[name] = round(value, 6) if isinstance(value, float) else value
+    for endpoint, c in counters.items():
+        lookups = c.get("hits", 0) + c.get("misses", 0)
+        if lookups:
+            c["hit_rate"] = round(c.get("hits", 0) / lookups, 4)
+    return {"cache": CACHE.stats(), "endpoints": counters}
+
+
+def metrics_text():
+    lines = []
+    described = set()
+
+    def metric(name, value, help_text, labels="", kind="counter"):
+        if name not in described:
+            lines.append(f"# HELP ollama_cache_{name} {help_text}")
+            lines.append(f"# TYPE ollama_cache_{name} {kind}")
+            described.add(name)
+        lines.append(f"ollama_cache_{name}{labels} {value}")
+
+    help_texts = {
+        "hits": "Requests (or embedding inputs) answered from the cache",
+        "misses": "Requests (or embedding inputs) forwarded to Ollama",
+        "uncacheable": "Requests passed through because they are not deterministic",
+        "batches": "Upstream /api/embed calls made by the batcher",
+        "batched_inputs": "Inputs sent in batched /api/embed calls",
+        "upstream_seconds": "Time spent waiting on Ollama for cache misses",
+        "saved_seconds": "Upstream time the cache hits would have taken",
+        "evictions": "Entries evicted to stay under the size limit",
+    }
+    for (name, endpoint), value in sorted(METRICS.snapshot().items()):
+        metric(f"{name}_total", value, help_texts.get(name, name), f'{{endpoint="{endpoint}"}}')
+    cache = CACHE.stats()
+    metric("entries", cache["entries"], "Entries in the cache", kind="gauge")
+    metric("bytes", cache["bytes"], "Bytes used by the cache", kind="gauge")
+    metric("max_bytes", cache["max_bytes"], "Cache size limit", kind="gauge")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    global CACHE
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    CACHE = DiskLRU(CACHE_DIR, MAX_BYTES)
+    server = ThreadingHTTPServer((LISTEN, PORT), Handler)
+    server.daemon_threads = True
+    print(f"Caching {UPSTREAM.geturl()} on {LISTEN}:{PORT} "
+          f"({CACHE.stats()['entries']} entries, limit {MAX_BYTES // 1048576} MB)", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,142 @@
 """Ollama — local LLM inference server."""
 
+import ctypes
+import fcntl
+import hashlib
+import json
 import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.request import Request, urlopen
 
 from appstore import BaseApp, run
 
+REGISTRY = "https://registry.ollama.ai"
+MANIFEST_ACCEPT = "application/vnd.docker.distribution.manifest.v2+json"
+
+# Node-local model store, bind-mounted from the host and shared by every
+# Ollama container on the node. Same layout as an Ollama models directory.
+# It is a separate mount from models_path, so blobs found there are copied
+# into the container rather than downloaded again.
+MODEL_STORE = "/mnt/model-store"
+
+# Memory reserved for the Ollama runtime, compute buffers and the OS
+RUNTIME_OVERHEAD_MB = 1024
+MIN_NUM_CTX = 2048
+# Parallel slots Ollama picks at most when OLLAMA_NUM_PARALLEL=0
+OLLAMA_AUTO_PARALLEL = 4
+KV_CACHE_SCALE = {"f16": 1.0, "q8_0": 0.5, "q4_0": 0.25}
+
+CHUNK_SIZE = 64 * 1024 * 1024
+CHUNK_RETRIES = 3
+
+# PCI vendor IDs of DRI render devices
+DRI_VENDORS = {"0x8086": "intel", "0x1002": "amd"}
+
+# Where the passed-through NVIDIA driver libraries live; nvidia-env.conf puts
+# the first on the service's LD_LIBRARY_PATH, the installer has to look there itself
+NVIDIA_LIB_DIRS = ["/usr/lib/nvidia", "/usr/lib/x86_64-linux-gnu", "/usr/lib64"]
+# ROCm runtime bundled by the Ollama installer when it sees an AMD GPU
+ROCM_LIB_DIRS = ["/usr/local/lib/ollama/rocm", "/usr/lib/ollama/rocm"]
+
+# Optional caching proxy (cache-proxy.py) in front of the API
+CACHE_PROXY_SCRIPT = "/usr/share/ollama/cache-proxy.py"
+CACHE_PROXY_UNIT = "/etc/systemd/system/ollama-cache.service"
+CACHE_DIR = "/var/lib/ollama-cache"
+
+PROBE_PROMPT = "Explain in one sentence why the sky is blue."
+PROBE_TOKENS = 64
+
+
+def _container_cores():
+    """CPU cores available to this container (cpuset, then cgroup v2 quota)."""
+    cores = len(os.sched_getaffinity(0))
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def _container_memory_mb():
+    """Memory available to this container (cgroup v2 limit, then /proc/meminfo)."""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            return int(limit) // (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    return 0
+
+
+def _split_model(model):
+    """Split 'name[:tag]' into (namespace, name, tag) registry coordinates."""
+    name, _, tag = model.partition(":")
+    namespace, _, repo = name.rpartition("/")
+    return namespace or "library", repo, tag or "latest"
+
+
+def _manifest_path(models_dir, model):
+    namespace, name, tag = _split_model(model)
+    return os.path.join(models_dir, "manifests", "registry.ollama.ai", namespace, name, tag)
+
+
+def _blob_path(models_dir, digest):
+    return os.path.join(models_dir, "blobs", digest.replace(":", "-"))
+
+
+def _blob_complete(path, size):
+    return os.path.isfile(path) and os.path.getsize(path) == size
+
+
+def _copy_blob(src, dst):
+    """Copy a store blob into models_path through a temp file, so an
+    interrupted copy is never taken as complete."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, dst + ".partial")
+    os.replace(dst + ".partial", dst)
+
+
+@contextmanager
+def _store_lock(path):
+    """Hold an exclusive flock on path + ".lock", so concurrent installs on
+    the node download a store blob once and never share its .partial file."""
+    with open(path + ".lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _load_cuda():
+    """Load the CUDA driver, trying the passthrough library dirs first.
+
+    Returns (library, path, device count); raises OSError listing every attempt.
+    """
+    errors = []
+    for lib in [os.path.join(d, "libcuda.so.1") for d in NVIDIA_LIB_DIRS] + ["libcuda.so.1"]:
+        if os.path.isabs(lib) and not os.path.exists(lib):
+            continue
+        try:
+            cuda = ctypes.CDLL(lib)
+            count = ctypes.c_int(0)
+            if cuda.cuInit(0) != 0 or cuda.cuDeviceGetCount(ctypes.byref(count)) != 0 \
+                    or count.value == 0:
+                raise OSError("cuInit failed or no CUDA devices visible")
+            return cuda, lib, count.value
+        except (OSError, AttributeError) as e:
+            errors.append(f"{lib}: {e}")
+    raise OSError("; ".join(errors))
+
 
 class OllamaApp(BaseApp):
     def _detect_gpu(self):
@@ -12,17 +145,372 @@ class OllamaApp(BaseApp):
             self.log.info("NVIDIA GPU detected (/dev/nvidia0 present)")
             return "nvidia"
         if os.path.exists("/dev/dri/renderD128"):
-            self.log.info("DRI render device detected (/dev/dri/renderD128)")
-            return "dri"
+            try:
+                with open("/sys/class/drm/renderD128/device/vendor") as f:
+                    vendor = DRI_VENDORS.get(f.read().strip(), "dri")
+            except OSError:
+                vendor = "dri"
+            self.log.info(f"DRI render device detected (/dev/dri/renderD128, vendor: {vendor})")
+            return vendor
         self.log.info("No GPU devices detected — running in CPU-only mode")
         return None
 
+    def _select_backend(self, gpu_type):
+        """Pick the acceleration backend for gpu_type and verify it can actually load.
+
+        Returns "cuda", "rocm", "vulkan" or "cpu". A CUDA driver that does not
+        load here is only warned about: the service runs with a different
+        library path, and the inference probe reports where the model really ran.
+        """
+        if gpu_type is None:
+            return "cpu"
+
+        if gpu_type == "nvidia":
+            try:
+                _, lib, count = _load_cuda()
+                self.log.info(f"CUDA driver loaded from {lib} ({count} device(s))")
+            except OSError as e:
+                self.log.warn(f"NVIDIA device present but the CUDA driver could not be verified "
+                              f"({e}). Configuring CUDA anyway — host and container "
+                              f"driver versions must match, check the inference probe below.")
+            return "cuda"
+
+        # DRI render nodes: the service user needs access to the device
+        self.run_command(["usermod", "-aG", "render,video", "ollama"], check=False)
+
+        if gpu_type == "amd":
+            rocm = next((d for d in ROCM_LIB_DIRS if os.path.isdir(d)), None)
+            if os.path.exists("/dev/kfd") and rocm:
+                self.log.info(f"AMD GPU with /dev/kfd and ROCm runtime in {rocm} — using ROCm backend")
+                return "rocm"
+            if rocm:
+                self.log.warn("AMD render device present but /dev/kfd is not passed through — "
+                              "ROCm cannot run. Trying Vulkan instead.")
+            else:
+                self.log.warn("AMD render device present but the Ollama installer did not add its "
+                              "ROCm runtime. Trying Vulkan instead.")
+
+        self.pkg_install("libvulkan1", "mesa-vulkan-drivers")
+        try:
+            ctypes.CDLL("libvulkan.so.1")
+        except OSError as e:
+            self.log.warn(f"Vulkan loader does not load: {e} — FALLING BACK TO CPU.")
+            return "cpu"
+        self.log.info(f"Using Vulkan backend for {gpu_type} GPU")
+        return "vulkan"
+
+    def _gpu_memory_mb(self, backend):
+        """Dedicated memory of the first GPU for backend, or 0 when there is
+        none (CPU, integrated GPUs sharing system RAM) or it cannot be read."""
+        if backend == "cuda":
+            try:
+                cuda, _, _ = _load_cuda()
+                device, total = ctypes.c_int(0), ctypes.c_size_t(0)
+                if cuda.cuDeviceGet(ctypes.byref(device), 0) == 0 and \
+                        cuda.cuDeviceTotalMem_v2(ctypes.byref(total), device) == 0:
+                    return total.value // (1024 * 1024)
+            except (OSError, AttributeError):
+                pass
+            return 0
+        if backend in ("rocm", "vulkan"):
+            # amdgpu only; Intel GPUs have no VRAM counter here and share RAM
+            try:
+                with open("/sys/class/drm/renderD128/device/mem_info_vram_total") as f:
+                    return int(f.read()) // (1024 * 1024)
+            except (OSError, ValueError):
+                return 0
+        return 0
+
+    def _probe_inference(self, api_url, model, backend, num_ctx):
+        """Run a short generation and report tokens/sec and where the model ran."""
+        body = json.dumps({
+            "model": model,
+            "prompt": PROBE_PROMPT,
+            "stream": False,
+            "options": {"num_predict": PROBE_TOKENS, "num_ctx": num_ctx},
+        }).encode()
+        req = Request(f"{api_url}/api/generate", data=body,
+                      headers={"Content-Type": "application/json"})
+        with urlopen(req, timeout=600) as resp:
+            result = json.load(resp)
+        tokens = result.get("eval_count", 0)
+        seconds = result.get("eval_duration", 0) / 1e9
+        rate = tokens / seconds if seconds else 0.0
+
+        with urlopen(f"{api_url}/api/ps", timeout=10) as resp:
+            loaded = json.load(resp).get("models", [])
+        entry = next((m for m in loaded if m.get("name", "").split(":")[0] == model.split(":")[0]), {})
+        size, vram = entry.get("size", 0), entry.get("size_vram", 0)
+        gpu_share = int(100 * vram / size) if size else 0
+
+        self.log.info(f"Inference probe: {tokens} tokens at {rate:.1f} tokens/s, "
+                      f"{gpu_share}% of {model} on GPU")
+        if backend != "cpu" and gpu_share == 0:
+            self.log.warn(f"{backend.upper()} backend configured but {model} ran entirely on the CPU — "
+                          f"expect ~10x lower throughput. Check GPU passthrough and "
+                          f"journalctl -u ollama for library load errors.")
+        elif 0 < gpu_share < 100:
+            self.log.warn(f"Only {gpu_share}% of {model} fits in GPU memory — the rest runs on the CPU")
+
+    def _required_memory_mb(self, hints, num_ctx, num_parallel, kv_cache_type):
+        """Estimate resident memory for a model: weights + KV cache + runtime."""
+        kv_bytes = hints["kv_bytes_per_token"] * KV_CACHE_SCALE.get(kv_cache_type, 1.0)
+        kv_mb = kv_bytes * num_ctx * max(num_parallel, 1) / (1024 * 1024)
+        return int(hints["weights_mb"] + kv_mb + RUNTIME_OVERHEAD_MB)
+
+    def _size_for_model(self, model, num_ctx, num_parallel, kv_cache_type, auto_size, vram_mb):
+        """Check the model fits this container and return a num_ctx that does.
+
+        Uses the per-model hints in models.json. The budget is GPU memory when
+        the model's weights fit there (vram_mb), else GPU and system memory
+        together, else container memory. Warns when cores or memory are below
+        what the model needs; with auto_size, shrinks num_ctx until the KV
+        cache fits instead of letting the model swap or get OOM-killed.
+        """
+        hints = json.loads(self.provision_file("models.json")).get(model.split(":")[0])
+        if not hints:
+            return num_ctx
+
+        cores = _container_cores()
+        memory_mb = _container_memory_mb()
+        # With OLLAMA_NUM_PARALLEL=0 Ollama may pick several slots, each with its own KV cache
+        num_parallel = num_parallel or OLLAMA_AUTO_PARALLEL
+        if vram_mb and hints["weights_mb"] + RUNTIME_OVERHEAD_MB <= vram_mb:
+            budget_mb, budget = vram_mb, "GPU memory"
+        elif vram_mb:
+            budget_mb, budget = vram_mb + memory_mb, "GPU and container memory"
+            self.log.warn(f"{model} weights do not fit in {vram_mb} MB of GPU memory — "
+                          f"part of the model will run on the CPU")
+        else:
+            budget_mb, budget = memory_mb, "container memory"
+
+        if num_ctx > hints["max_ctx"]:
+            self.log.info(f"{model} supports at most {hints['max_ctx']} context tokens — "
+                          f"clamping num_ctx from {num_ctx}")
+            num_ctx = hints["max_ctx"]
+
+        required = self._required_memory_mb(hints, num_ctx, num_parallel, kv_cache_type)
+        self.log.info(f"{model} ({hints['params']}) at num_ctx={num_ctx} x {num_parallel} parallel "
+                      f"needs ~{required} MB; {budget_mb} MB of {budget}, {cores} cores")
+
+        if cores < hints["recommended_cores"]:
+            self.log.warn(f"{model} runs best with {hints['recommended_cores']}+ cores "
+                          f"(container has {cores}) — expect slow token generation")
+
+        if required > budget_mb and auto_size:
+            fitted = num_ctx
+            while fitted > MIN_NUM_CTX and \
+                    self._required_memory_mb(hints, fitted, num_parallel, kv_cache_type) > budget_mb:
+                fitted //= 2
+            fitted = max(fitted, MIN_NUM_CTX)
+            if fitted != num_ctx:
+                self.log.warn(f"Reducing num_ctx from {num_ctx} to {fitted} to fit {budget_mb} MB of {budget}")
+                num_ctx = fitted
+                required = self._required_memory_mb(hints, num_ctx, num_parallel, kv_cache_type)
+
+        if required > budget_mb:
+            more = ", increase memory_mb" if budget == "container memory" else ""
+            self.log.warn(f"{model} needs ~{required} MB but there is {budget_mb} MB of {budget} — "
+                          f"it will spill to the CPU, swap or be OOM-killed. Lower num_ctx or "
+                          f"num_parallel{more}, or choose a smaller model.")
+        return num_ctx
+
+    def _fetch_manifest(self, model):
+        """Return the raw registry manifest for model, preferring the node store."""
+        cached = _manifest_path(MODEL_STORE, model)
+        if os.path.isfile(cached):
+            self.log.info(f"Using manifest for {model} from node model store")
+            with open(cached, "rb") as f:
+                return f.read()
+        namespace, name, tag = _split_model(model)
+        req = Request(f"{REGISTRY}/v2/{namespace}/{name}/manifests/{tag}",
+                      headers={"Accept": MANIFEST_ACCEPT})
+        with urlopen(req, timeout=30) as resp:
+            return resp.read()
+
+    def _resolve_blob_url(self, model, digest):
+        """Follow the registry redirect once so ranged requests hit the CDN directly."""
+        namespace, name, _ = _split_model(model)
+        req = Request(f"{REGISTRY}/v2/{namespace}/{name}/blobs/{digest}",
+                      headers={"Range": "bytes=0-0"})
+        with urlopen(req, timeout=30) as resp:
+            return resp.geturl()
+
+    def _fetch_blob(self, model, layer, dest, connections):
+        """Download a blob with parallel ranged requests, resuming a previous partial."""
+        digest, size = layer["digest"], layer["size"]
+        partial = dest + ".partial"
+        state_file = partial + ".json"
+        chunks = [(off, min(off + CHUNK_SIZE, size) - 1) for off in range(0, size, CHUNK_SIZE)]
+
+        done = set()
+        if os.path.exists(partial) and os.path.exists(state_file):
+            with open(state_file) as f:
+                done = set(json.load(f))
+            self.log.info(f"Resuming {digest[:19]}: {len(done)}/{len(chunks)} chunks present")
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        url = self._resolve_blob_url(model, digest)
+        lock = threading.Lock()
+        fd = os.open(partial, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+
+            def fetch_chunk(index):
+                nonlocal url
+                start, end = chunks[index]
+                for attempt in range(CHUNK_RETRIES):
+                    try:
+                        req = Request(url, headers={"Range": f"bytes={start}-{end}"})
+                        with urlopen(req, timeout=60) as resp:
+                            offset = start
+                            while True:
+                                buf = resp.read(1024 * 1024)
+                                if not buf:
+                                    break
+                                os.pwrite(fd, buf, offset)
+                                offset += len(buf)
+                        if offset != end + 1:
+                            raise IOError(f"short read: {offset - start}/{end - start + 1} bytes")
+                        break
+                    except Exception:
+                        if attempt == CHUNK_RETRIES - 1:
+                            raise
+                        # Signed CDN URLs expire on long downloads — re-resolve and retry
+                        with lock:
+                            url = self._resolve_blob_url(model, digest)
+                with lock:
+                    done.add(index)
+                    with open(state_file, "w") as f:
+                        json.dump(sorted(done), f)
+
+            started = time.monotonic()
+            pending = [i for i in range(len(chunks)) if i not in done]
+            with ThreadPoolExecutor(max_workers=connections) as pool:
+                list(pool.map(fetch_chunk, pending))
+        finally:
+            os.close(fd)
+
+        sha = hashlib.sha256()
+        with open(partial, "rb") as f:
+            for buf in iter(lambda: f.read(16 * 1024 * 1024), b""):
+                sha.update(buf)
+        if f"sha256:{sha.hexdigest()}" != digest:
+            os.remove(partial)
+            os.remove(state_file)
+            raise IOError(f"checksum mismatch for {digest}")
+        os.replace(partial, dest)
+        os.remove(state_file)
+
+        elapsed = max(time.monotonic() - started, 0.001)
+        self.log.info(f"Fetched {digest[:19]} ({size / 1e6:.0f} MB) at {size / 1e6 / elapsed:.1f} MB/s")
+
+    def _stage_model(self, model, models_path, connections):
+        """Seed models_path with model's blobs, from the node store when present.
+
+        Blobs missing from the store are downloaded into it (when writable) so the
+        next container on this node can copy them instead of downloading again.
+        """
+        store = MODEL_STORE if os.path.isdir(MODEL_STORE) else None
+        store_writable = bool(store) and os.access(store, os.W_OK)
+        if store:
+            self.log.info(f"Node model store found at {MODEL_STORE} "
+                          f"({'read-write' if store_writable else 'read-only'})")
+
+        raw = self._fetch_manifest(model)
+        manifest = json.loads(raw)
+        methods = {}
+        for layer in [manifest["config"]] + manifest["layers"]:
+            digest, size = layer["digest"], layer["size"]
+            target = _blob_path(models_path, digest)
+            if _blob_complete(target, size):
+                continue
+            if store:
+                cached = _blob_path(store, digest)
+                if not _blob_complete(cached, size) and store_writable:
+                    os.makedirs(os.path.dirname(cached), exist_ok=True)
+                    with _store_lock(cached):
+                        # Another container may have fetched it while we waited
+                        if not _blob_complete(cached, size):
+                            self._fetch_blob(model, layer, cached, connections)
+                if _blob_complete(cached, size):
+                    _copy_blob(cached, target)
+                    methods["copy"] = methods.get("copy", 0) + 1
+                    continue
+            self._fetch_blob(model, layer, target, connections)
+            methods["download"] = methods.get("download", 0) + 1
+
+        manifest_dirs = [models_path] + ([store] if store_writable else [])
+        for models_dir in manifest_dirs:
+            path = _manifest_path(models_dir, model)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(raw)
+
+        summary = ", ".join(f"{n} {m}" for m, n in sorted(methods.items())) or "already present"
+        self.log.info(f"Model {model} staged ({summary})")
+
+    def _setup_cache_proxy(self, api_port, bind_address):
+        """Run (or remove) the ollama-cache sidecar that answers repeat
+        embedding and temperature-0 requests from a disk cache."""
+        if not self.inputs.boolean("cache_proxy", False):
+            if os.path.exists(CACHE_PROXY_UNIT):
+                self.run_command(["systemctl", "disable", "--now", "ollama-cache"], check=False)
+                self.run_command(["rm", "-f", CACHE_PROXY_UNIT])
+                self.run_command(["systemctl", "daemon-reload"])
+                self.log.info("Cache proxy removed")
+            return
+
+        cache_port = self.inputs.integer("cache_port", 11435)
+        cache_size_mb = self.inputs.integer("cache_size_mb", 1024)
+        batch_ms = self.inputs.integer("cache_batch_ms", 5)
+        if cache_port == api_port:
+            raise ValueError(f"cache_port {cache_port} is the Ollama API port — pick another")
+
+        self.deploy_provision_file("cache-proxy.py", CACHE_PROXY_SCRIPT, mode="0755")
+        self.create_dir(CACHE_DIR, owner="ollama:ollama")
+        self.create_service("ollama-cache",
+            exec_start=f"/usr/bin/python3 {CACHE_PROXY_SCRIPT}",
+            description="Ollama response and embedding cache",
+            after="ollama.service",
+            user="ollama",
+            environment={
+                "OLLAMA_CACHE_UPSTREAM": f"http://127.0.0.1:{api_port}",
+                "OLLAMA_CACHE_HOST": bind_address,
+                "OLLAMA_CACHE_PORT": str(cache_port),
+                "OLLAMA_CACHE_DIR": CACHE_DIR,
+                "OLLAMA_CACHE_SIZE_MB": str(cache_size_mb),
+                "OLLAMA_CACHE_BATCH_MS": str(batch_ms),
+            },
+            restart="always",
+            restart_sec=5,
+        )
+        # Pick up a changed port or size on reinstall
+        self.restart_service("ollama-cache")
+        self.log.info(f"Cache proxy on port {cache_port} ({cache_size_mb} MB disk cache) — "
+                      f"point clients there to reuse embeddings and temperature-0 answers")
+
     def install(self):
         api_port = self.inputs.integer("api_port", 11434)
         bind_address = self.inputs.string("bind_address", "0.0.0.0")
         models_path = self.inputs.string("models_path", "/usr/share/ollama/.ollama/models")
         num_ctx = self.inputs.integer("num_ctx", 2048)
         default_model = self.inputs.string("model", "")
+        model_source = self.inputs.string("model_source", "store")
+        download_connections = self.inputs.integer("download_connections", 8)
+        keep_alive = self.inputs.string("keep_alive", "30m")
+        num_parallel = self.inputs.integer("num_parallel", 0)
+        max_loaded_models = self.inputs.integer("max_loaded_models", 0)
+        flash_attention = self.inputs.boolean("flash_attention", True)
+        kv_cache_type = self.inputs.string("kv_cache_type", "f16")
+        preload_model = self.inputs.boolean("preload_model", True)
+        auto_size = self.inputs.boolean("auto_size", True)
+        inference_probe = self.inputs.boolean("inference_probe", True)
+
+        # Quantized KV cache is only honoured with flash attention enabled
+        if kv_cache_type != "f16" and not flash_attention:
+            self.log.warn(f"KV cache type {kv_cache_type} requires flash attention — using f16")
+            kv_cache_type = "f16"
 
         # Detect GPU before install
         gpu_type = self._detect_gpu()
@@ -30,11 +518,26 @@ class OllamaApp(BaseApp):
         # Install Ollama via upstream installer script
         self.run_installer_script("https://ollama.ai/install.sh")
 
+        # Verify the GPU runtime actually loads before configuring it
+        backend = self._select_backend(gpu_type)
+
+        # Fit the context window to the backend's memory before it's baked into the override
+        if default_model:
+            vram_mb = self._gpu_memory_mb(backend)
+            num_ctx = self._size_for_model(default_model, num_ctx, num_parallel,
+                                           kv_cache_type, auto_size, vram_mb)
+
         # Build systemd override config from template
         override = self.provision_file("systemd-override.conf")
-        if gpu_type == "nvidia":
+        if backend == "cuda":
             self.log.info("Configuring NVIDIA GPU environment for Ollama")
             override += self.provision_file("nvidia-env.conf")
+        elif backend == "rocm":
+            self.log.info("Configuring ROCm GPU environment for Ollama")
+            override += self.provision_file("rocm-env.conf")
+        elif backend == "vulkan":
+            self.log.info("Configuring Vulkan GPU environment for Ollama")
+            override += self.provision_file("vulkan-env.conf")
 
         # Configure environment overrides
         self.create_dir("/etc/systemd/system/ollama.service.d")
@@ -45,17 +548,34 @@ class OllamaApp(BaseApp):
             api_port=api_port,
             models_path=models_path,
             num_ctx=num_ctx,
+            keep_alive=keep_alive,
+            num_parallel=num_parallel,
+            max_loaded_models=max_loaded_models,
+            flash_attention="1" if flash_attention else "0",
+            kv_cache_type=kv_cache_type,
         )
 
-        # Ensure models directory and parent .ollama dir exist with correct ownership
+        # Ensure models directory exists before seeding it
         self.create_dir(models_path)
+
+        # Seed the default model from the node store / parallel download —
+        # no API needed, so this runs before the service restarts.
+        staged = False
+        if default_model and model_source == "store":
+            try:
+                self._stage_model(default_model, models_path, download_connections)
+                staged = True
+            except Exception as e:
+                self.log.warn(f"Model staging failed, falling back to ollama pull: {e}")
+
+        # Parent .ollama dir and staged model files must belong to the service user
         self.chown("/usr/share/ollama/.ollama", "ollama:ollama", recursive=True)
 
         # Restart with new config
         self.restart_service("ollama")
 
-        # Pull default model if specified
-        if default_model:
+        # Pull default model if specified and not already staged
+        if default_model and not staged:
             api_url = f"http://127.0.0.1:{api_port}"
             if self.wait_for_http(api_url, timeout=60, interval=2):
                 self.log.info(f"Pulling model: {default_model}")
@@ -68,10 +588,33 @@ class OllamaApp(BaseApp):
                 self.log.warn("Skipping model pull — Ollama API not ready")
                 self.log.info("Pull model manually after service starts: ollama pull " + default_model)
 
-        if gpu_type == "nvidia":
-            self.log.info("Ollama installed with NVIDIA GPU support")
-        else:
+        # Keep the default model resident from boot so first-token latency is steady
+        if default_model and preload_model:
+            self.deploy_provision_file("warmup.py", "/usr/share/ollama/warmup.py")
+            self.render_template("ollama-warmup.service",
+                "/etc/systemd/system/ollama-warmup.service",
+                api_port=api_port,
+                model=default_model,
+                num_ctx=num_ctx,
+            )
+            self.enable_service("ollama-warmup")
+            self.log.info(f"Preloading {default_model} after every Ollama start (keep-alive {keep_alive})")
+
+        # Catch silent CPU fallback: measure a real generation on the installed backend
+        if default_model and inference_probe:
+            api_url = f"http://127.0.0.1:{api_port}"
+            if self.wait_for_http(api_url, timeout=60, interval=2):
+                try:
+                    self._probe_inference(api_url, default_model, backend, num_ctx)
+                except Exception as e:
+                    self.log.warn(f"Inference probe failed (non-fatal): {e}")
+
+        self._setup_cache_proxy(api_port, bind_address)
+
+        if backend == "cpu":
             self.log.info("Ollama installed (CPU mode)")
+        else:
+            self.log.info(f"Ollama installed with {backend.upper()} GPU support")
 
 
 run(OllamaApp)
@@ -0,0 +1,54 @@
+"""Preload the default Ollama model so the first request doesn't pay the load.
+
+Run by ollama-warmup.service after every ollama.service start. Waits for the
+API, then sends an empty generate request, which loads the model and keeps it
+resident for OLLAMA_KEEP_ALIVE.
+"""
+import json
+import os
+import sys
+import time
+from urllib.request import Request, urlopen
+
+API_URL = os.environ.get("OLLAMA_WARMUP_URL", "http://127.0.0.1:11434")
+MODEL = os.environ.get("OLLAMA_WARMUP_MODEL", "")
+NUM_CTX = int(os.environ.get("OLLAMA_WARMUP_NUM_CTX", "2048"))
+API_TIMEOUT = 120
+
+
+def wait_for_api():
+    deadline = time.monotonic() + API_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            with urlopen(f"{API_URL}/api/version", timeout=5):
+                return True
+        except OSError:
+            time.sleep(2)
+    return False
+
+
+def main():
+    if not MODEL:
+        return 0
+    if not wait_for_api():
+        print(f"Ollama API not ready after {API_TIMEOUT}s — skipping warm-up", file=sys.stderr)
+        return 1
+
+    # Load with the same num_ctx clients get by default, otherwise the first
+    # real request would trigger a reload with a different context size.
+    body = json.dumps({"model": MODEL, "options": {"num_ctx": NUM_CTX}}).encode()
+    req = Request(f"{API_URL}/api/generate", data=body,
+                  headers={"Content-Type": "application/json"})
+    started = time.monotonic()
+    try:
+        with urlopen(req, timeout=600) as resp:
+            resp.read()
+    except OSError as e:
+        print(f"Warm-up of {MODEL} failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Loaded {MODEL} in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
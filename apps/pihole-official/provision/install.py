@@ -28,14 +28,16 @@ class PiholeOfficial(BaseApp):
         dns_1 = self.inputs.string("dns_1")
         dns_2 = self.inputs.string("dns_2")
         dnsmasq_listening = self.inputs.string("dnsmasq_listening")
+        cache_size = self.inputs.integer("cache_size", 10000)
+        query_logging = self.inputs.boolean("query_logging", True)
 
         setup_vars = (
             "PIHOLE_INTERFACE=eth0\n"
             f"PIHOLE_DNS_1={dns_1}\n"
             f"PIHOLE_DNS_2={dns_2}\n"
             f"DNSMASQ_LISTENING={dnsmasq_listening}\n"
-            "QUERY_LOGGING=true\n"
-            "CACHE_SIZE=10000\n"
+            f"QUERY_LOGGING={'true' if query_logging else 'false'}\n"
+            f"CACHE_SIZE={cache_size}\n"
             "DNS_FQDN_REQUIRED=true\n"
             "DNS_BOGUS_PRIV=true\n"
             "BLOCKING_ENABLED=true\n"
@@ -54,7 +56,22 @@ class PiholeOfficial(BaseApp):
         # LXC containers inherit time from host — disable FTL's NTP client
       self.run_command(["pihole-FTL", "--config", "ntp.sync.active", "false"])
       
+      # Cache and query-log sizing (pihole.toml)
+      cache_size = self.inputs.integer("cache_size", 10000)
+      query_logging = self.inputs.boolean("query_logging", True)
+      history_hours = self.inputs.integer("query_history_hours", 24)
+      db_max_days = self.inputs.integer("db_max_days", 91)
+      for key, value in [
+          ("dns.cache.size", cache_size),
+          ("dns.queryLogging", "true" if query_logging else "false"),
+          # Queries kept in memory for the dashboard graphs, in seconds
+          ("webserver.api.maxHistory", history_hours * 3600),
+          # Long-term database retention; 0 disables the database
+          ("database.maxDBdays", db_max_days),
+      ]:
+          self.run_command(["pihole-FTL", "--config", key, f"{value}"])
+
       self.restart_service("pihole-FTL")
 
 
-run(PiholeOfficial)
\ No newline at end of file
+run(PiholeOfficial)
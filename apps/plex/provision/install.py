@@ -1,7 +1,26 @@
 """Plex Media Server — personal media streaming."""
 
+import xml.etree.ElementTree as ET
+
 from appstore import BaseApp, run
 
+PREFS_DIR = "/var/lib/plexmediaserver/Library/Application Support/Plex Media Server"
+PREFS_XML = f"{PREFS_DIR}/Preferences.xml"
+
+# Background analysis inputs -> Preferences.xml attributes. Each takes
+# never, scheduled (maintenance window only) or asap (also when media is added).
+ANALYSIS_PREFS = {
+    "video_preview_thumbnails": "GenerateBIFBehavior",
+    "intro_detection": "GenerateIntroMarkerBehavior",
+    "credits_detection": "GenerateCreditsMarkerBehavior",
+    "loudness_analysis": "LoudnessAnalysisBehavior",
+    "chapter_thumbnails": "GenerateChapterThumbBehavior",
+}
+
+# scheduled_scan input -> ScheduledLibraryUpdateInterval (seconds)
+SCAN_INTERVALS = {"15m": 900, "30m": 1800, "1h": 3600, "2h": 7200,
+                  "6h": 21600, "12h": 43200, "24h": 86400}
+
 
 class PlexApp(BaseApp):
     def install(self):
@@ -32,9 +51,8 @@ class PlexApp(BaseApp):
             self.log.info("Claim token provided — server will be linked to your Plex account")
 
         # Write Plex preferences — preserve existing on reinstall with kept volume
-        prefs_dir = "/var/lib/plexmediaserver/Library/Application Support/Plex Media Server"
-        self.create_dir(prefs_dir)
-        self.render_template("Preferences.xml", f"{prefs_dir}/Preferences.xml",
+        self.create_dir(PREFS_DIR)
+        self.render_template("Preferences.xml", PREFS_XML,
             preserve_existing=True,
             friendly_name=friendly_name,
             http_port=http_port,
@@ -43,8 +61,55 @@ class PlexApp(BaseApp):
         )
         self.chown("/var/lib/plexmediaserver", "plex:plex", recursive=True)
 
+        # Background task and transcoder settings; enable_service starts Plex
+        self.configure(restart=False)
+
         self.enable_service("plexmediaserver")
         self.log.info("Plex Media Server installed successfully")
 
+    def configure(self, restart=True):
+        """Merge the performance inputs into Preferences.xml. Called by install() and reconfigure."""
+        start_hour = self.inputs.integer("maintenance_start_hour", 2)
+        end_hour = self.inputs.integer("maintenance_end_hour", 5)
+        scheduled_scan = self.inputs.string("scheduled_scan", "disabled")
+
+        prefs = {attr: self.inputs.string(key, "scheduled") for key, attr in ANALYSIS_PREFS.items()}
+        prefs.update({
+            "ButlerStartHour": start_hour,
+            "ButlerEndHour": end_hour,
+            "ScheduledLibraryUpdatesEnabled": int(scheduled_scan in SCAN_INTERVALS),
+            "FSEventLibraryUpdatesEnabled": int(self.inputs.boolean("scan_on_change", True)),
+            "TranscoderThrottleBuffer": self.inputs.integer("transcoder_throttle_buffer", 60),
+            "TranscoderH264BackgroundPreset": self.inputs.string("transcoder_background_preset", "veryfast"),
+        })
+        if scheduled_scan in SCAN_INTERVALS:
+            prefs["ScheduledLibraryUpdateInterval"] = SCAN_INTERVALS[scheduled_scan]
+
+        # Plex rewrites Preferences.xml on shutdown, so stop it before editing
+        self.run_command(["systemctl", "stop", "plexmediaserver"], check=False)
+        self._merge_prefs(prefs)
+        self.log.info(
+            f"Background tasks: {', '.join(f'{k}={prefs[v]}' for k, v in ANALYSIS_PREFS.items())}; "
+            f"maintenance window {start_hour:02d}:00-{end_hour:02d}:00, scheduled scan {scheduled_scan}"
+        )
+
+        if restart:
+            self.restart_service("plexmediaserver")
+
+    def _merge_prefs(self, prefs):
+        """Set attributes on <Preferences>, keeping everything else Plex has written there."""
+        try:
+            root = ET.parse(PREFS_XML).getroot()
+        except (FileNotFoundError, ET.ParseError):
+            root = ET.Element("Preferences")
+
+        for attr, value in prefs.items():
+            root.set(attr, str(value))
+
+        xml = '<?xml version="1.0" encoding="utf-8"?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+        # Escape $ so attribute values Plex wrote are kept verbatim, not substituted
+        self.write_config(PREFS_XML, xml.replace("$", "$$"))
+        self.chown(PREFS_XML, "plex:plex")
+
 
 run(PlexApp)
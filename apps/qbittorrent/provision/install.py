@@ -1,9 +1,45 @@
 """qBittorrent — lightweight BitTorrent client with WebUI (Alpine Linux)."""
 
+import configparser
+import io
 import os
 
 from appstore import BaseApp, run
 
+CONFIG_DIR = "/var/lib/qbittorrent/.config/qBittorrent"
+CONFIG_FILE = f"{CONFIG_DIR}/qBittorrent.conf"
+# OpenRC marks started services here
+STARTED_MARKER = "/run/openrc/started/qbittorrent-nox"
+
+
+def _container_cores():
+    """CPU cores available to this container (cpuset, then cgroup v2 quota)."""
+    cores = len(os.sched_getaffinity(0))
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def _container_memory_mb():
+    """Memory available to this container (cgroup v2 limit, then /proc/meminfo)."""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            return int(limit) // (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    return 0
+
 
 class QBittorrentApp(BaseApp):
     def install(self):
@@ -22,21 +58,19 @@ class QBittorrentApp(BaseApp):
         self.create_user("qbittorrent", system=True, home="/var/lib/qbittorrent")
 
         # Create directories
-        config_dir = "/var/lib/qbittorrent/.config/qBittorrent"
-        self.create_dir(config_dir)
+        self.create_dir(CONFIG_DIR)
         self.create_dir(download_path)
         self.create_dir(f"{download_path}/incomplete")
         
         # Only write config if it doesn't already exist (preserves settings on reinstall)
-        config_file = f"{config_dir}/qBittorrent.conf"
-        if not os.path.exists(config_file):
+        if not os.path.exists(CONFIG_FILE):
             # Generate PBKDF2 password hash for qBittorrent config
             h = self.pbkdf2_hash(password)
             password_hash = f"@ByteArray({h['salt']}:{h['hash']})"
 
             template = self.provision_file("qBittorrent.conf")
             self.write_config(
-                config_file,
+                CONFIG_FILE,
                 template,
                 torrent_port=torrent_port,
                 download_path=download_path,
@@ -44,6 +78,9 @@ class QBittorrentApp(BaseApp):
                 password_hash=password_hash,
             )
 
+        # Merge performance settings (also into a preserved config)
+        self.configure()
+
         # Set ownership of all qbittorrent data
         self.chown("/var/lib/qbittorrent", "qbittorrent:qbittorrent", recursive=True)
         self.chown(download_path, "qbittorrent:qbittorrent", recursive=True)
@@ -69,5 +106,57 @@ class QBittorrentApp(BaseApp):
         self.log.output("webui_password", password)
         self.log.info("qBittorrent installed successfully")
 
+    def configure(self):
+        """Merge [BitTorrent] performance settings into qBittorrent.conf.
+
+        Called by install() and reconfigure. 0 means auto-size from the
+        container's cores and memory.
+        """
+        cores = _container_cores()
+        memory_mb = _container_memory_mb()
+
+        def auto(key, default):
+            value = self.inputs.integer(key, 0)
+            return value if value > 0 else default
+
+        session = {
+            # libtorrent 2.x maps files instead of a disk cache; this caps
+            # the resident working set
+            "MemoryWorkingSetLimit": auto("memory_working_set_mb", max(256, memory_mb // 4)),
+            "AsyncIOThreadsCount": auto("async_io_threads", min(32, max(4, cores * 4))),
+            "HashingThreadsCount": auto("hashing_threads", max(1, cores // 2)),
+            "FilePoolSize": auto("file_pool_size", 500),
+            "MaxConnections": auto("max_connections", min(4000, max(500, memory_mb // 2))),
+            "MaxConnectionsPerTorrent": 100,
+            "QueueingSystemEnabled": "true",
+            "MaxActiveDownloads": self.inputs.integer("max_active_downloads", 5),
+            "MaxActiveUploads": self.inputs.integer("max_active_uploads", 20),
+            "MaxActiveTorrents": self.inputs.integer("max_active_torrents", 25),
+        }
+
+        # qBittorrent rewrites its config on exit — stop it before editing,
+        # and only start it again if it was running
+        running = os.path.exists(STARTED_MARKER)
+        if running:
+            self.run_command(["rc-service", "qbittorrent-nox", "stop"], check=False)
+
+        conf = configparser.ConfigParser(delimiters=("=",), interpolation=None, strict=False)
+        conf.optionxform = str
+        conf.read(CONFIG_FILE)
+        if not conf.has_section("BitTorrent"):
+            conf.add_section("BitTorrent")
+        for key, value in session.items():
+            conf.set("BitTorrent", f"Session\\{key}", str(value))
+
+        buf = io.StringIO()
+        conf.write(buf, space_around_delimiters=False)
+        # Escape $ so values in the user's config are written verbatim, not substituted
+        self.write_config(CONFIG_FILE, buf.getvalue().replace("$", "$$"))
+        self.chown(CONFIG_FILE, "qbittorrent:qbittorrent")
+        self.log.info("Session settings: " + ", ".join(f"{k}={v}" for k, v in session.items()))
+
+        if running:
+            self.restart_service("qbittorrent-nox")
+
 
 run(QBittorrentApp)
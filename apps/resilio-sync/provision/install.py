@@ -34,6 +34,12 @@ class ResilioSync(BaseApp):
         bind_address = self.inputs.string("bind_address", "0.0.0.0")
         webui_port = self.inputs.integer("webui_port", 8888)
         listening_port = self.inputs.integer("listening_port", 55555)
+        rescan_interval = self.inputs.integer("folder_rescan_interval", 600)
+        async_io = self.inputs.boolean("async_io", False)
+        disk_low_priority = self.inputs.boolean("disk_low_priority", True)
+        max_watchers = self.inputs.integer("max_fs_watchers", 0)
+        send_buf_mb = self.inputs.integer("send_buf_size", 5)
+        recv_buf_mb = self.inputs.integer("recv_buf_size", 5)
 
         # Load existing config to preserve secrets/shares, or start fresh
         try:
@@ -51,8 +57,20 @@ class ResilioSync(BaseApp):
             "listen": f"{bind_address}:{webui_port}",
         }
 
+        # Advanced (power user) settings, applied to all shared folders
+        conf["folder_rescan_interval"] = rescan_interval
+        conf["async_io"] = async_io
+        conf["disk_low_priority"] = disk_low_priority
+        conf["send_buf_size"] = send_buf_mb
+        conf["recv_buf_size"] = recv_buf_mb
+        if max_watchers > 0:
+            conf["max_file_system_watchers"] = max_watchers
+        else:
+            conf.pop("max_file_system_watchers", None)
+
         self.write_config(SYNC_CONF_PATH, json.dumps(conf, indent=2) + "\n")
-        self.log.info(f"Config written: listen={bind_address}:{webui_port}, sync port={listening_port}")
+        self.log.info(f"Config written: listen={bind_address}:{webui_port}, sync port={listening_port}, "
+                      f"rescan={rescan_interval}s, async_io={async_io}")
 
         # Restart service to pick up new config (no-op on first install)
         self.restart_service("resilio-sync")
@@ -0,0 +1,42 @@
+#!/bin/sh
+## SWAG LXC — Background certificate issuance
+## Started by provisioning (and at boot while a request is pending).
+## Retries certbot with backoff, then swaps the self-signed cert for the
+## Let's Encrypt one and reloads nginx.
+
+PENDING=/config/etc/letsencrypt/.appstore-pending
+CERT_PATH=$cert_path
+ATTEMPTS=$attempts
+
+exec 9>/run/swag-cert-issue.lock
+flock -n 9 || exit 0
+# Provisioning stops a running issuer through this when the settings change
+echo $$$$ > /run/swag-cert-issue.pid
+trap 'rm -f /run/swag-cert-issue.pid' EXIT
+exec >>/config/log/letsencrypt/issue.log 2>&1
+
+[ -f "$$PENDING" ] || exit 0
+
+i=1
+delay=60
+while [ "$$i" -le "$$ATTEMPTS" ]; do
+    echo "$$(date -Iseconds) certificate request, attempt $$i/$$ATTEMPTS"
+    if $certbot_cmd && [ -f "$$CERT_PATH/fullchain.pem" ]; then
+        # Replace each link in a single rename so nginx never sees a gap
+        ln -sf "$$CERT_PATH/fullchain.pem" /config/keys/cert.crt.new
+        ln -sf "$$CERT_PATH/privkey.pem" /config/keys/cert.key.new
+        mv -f /config/keys/cert.crt.new /config/keys/cert.crt
+        mv -f /config/keys/cert.key.new /config/keys/cert.key
+        rm -f "$$PENDING"
+        echo "$$(date -Iseconds) certificate installed from $$CERT_PATH"
+        nginx -t && rc-service nginx reload
+        exit 0
+    fi
+    i=$$((i + 1))
+    [ "$$i" -le "$$ATTEMPTS" ] && sleep "$$delay"
+    delay=$$((delay * 2))
+    [ "$$delay" -gt 1800 ] && delay=1800
+done
+
+echo "$$(date -Iseconds) giving up for now; self-signed cert stays active, retrying at next boot"
+exit 1
@@ -1,7 +1,24 @@
 #!/bin/sh
 ## SWAG LXC — Certbot auto-renewal script (runs via cron)
-## Renews certificates and reloads nginx on success
+## Checks expiry locally with openssl and only starts certbot when a
+## certificate is inside its renewal window; reloads nginx on success
 
+RENEW_WINDOW=$((30 * 86400))
+
+due=""
+for cert in /config/etc/letsencrypt/live/*/cert.pem; do
+    [ -f "$cert" ] || continue
+    if ! openssl x509 -checkend "$RENEW_WINDOW" -noout -in "$cert" >/dev/null; then
+        due="$due $(basename "$(dirname "$cert")")"
+    fi
+done
+
+if [ -z "$due" ]; then
+    logger -t certbot-renew "No certificate expires within 30 days, skipping certbot"
+    exit 0
+fi
+
+logger -t certbot-renew "Renewal window reached for:$due"
 /lsiopy/bin/certbot renew \
     --config-dir /config/etc/letsencrypt \
     --logs-dir /config/log/letsencrypt \
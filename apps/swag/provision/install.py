@@ -7,8 +7,84 @@ and 300+ preset proxy configs for popular apps.
 
 Based on linuxserver/docker-swag, adapted for LXC.
 """
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shlex
+import signal
+import time
+
 from appstore import BaseApp, run
 
+NGINX_DIR = "/config/nginx"
+PROXY_CONFS_DIR = f"{NGINX_DIR}/proxy-confs"
+UPSTREAMS_DIR = f"{NGINX_DIR}/upstreams"
+UPSTREAM_MARKER = "## SWAG LXC — managed upstream pool"
+CACHE_DIR = "/config/cache/nginx"
+PRESET_INDEX = f"{PROXY_CONFS_DIR}/index.json"
+ENABLED_STATE = f"{PROXY_CONFS_DIR}/.appstore-enabled.json"
+CERT_ISSUE_SCRIPT = "/usr/local/bin/swag-cert-issue"
+CERT_PENDING = "/config/etc/letsencrypt/.appstore-pending"
+CERT_ISSUE_LOCK = "/run/swag-cert-issue.lock"
+CERT_ISSUE_PID = "/run/swag-cert-issue.pid"
+CERT_ISSUE_ATTEMPTS = 5
+
+# key_type input → openssl req / certbot arguments
+OPENSSL_KEY_ARGS = {
+    "ecdsa-p256": ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1"],
+    "ecdsa-p384": ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:secp384r1"],
+    "rsa-2048":   ["-newkey", "rsa:2048"],
+    "rsa-4096":   ["-newkey", "rsa:4096"],
+}
+CERTBOT_KEY_ARGS = {
+    "ecdsa-p256": ["--key-type", "ecdsa", "--elliptic-curve", "secp256r1"],
+    "ecdsa-p384": ["--key-type", "ecdsa", "--elliptic-curve", "secp384r1"],
+    "rsa-2048":   ["--key-type", "rsa", "--rsa-key-size", "2048"],
+    "rsa-4096":   ["--key-type", "rsa", "--rsa-key-size", "4096"],
+}
+
+
+def _parse_upstreams(spec):
+    """Parse "name=host:port|host:port, ..." into {name: [server, ...]}."""
+    pools = {}
+    for entry in spec.split(","):
+        name, _, servers = entry.partition("=")
+        name = name.strip()
+        servers = [srv.strip() for srv in servers.split("|") if srv.strip()]
+        if re.fullmatch(r"[A-Za-z0-9_-]+", name) and servers:
+            pools[name] = servers
+    return pools
+
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _scan_presets():
+    """Describe every preset proxy conf shipped as a .conf.sample."""
+    presets = []
+    for fname in sorted(os.listdir(PROXY_CONFS_DIR)):
+        m = re.fullmatch(r"(.+)\.(subdomain|subfolder)\.conf\.sample", fname)
+        if not m:
+            continue
+        with open(os.path.join(PROXY_CONFS_DIR, fname)) as f:
+            text = f.read()
+        port = re.search(r"set \$upstream_port\s+(\d+);", text)
+        proto = re.search(r"set \$upstream_proto\s+(\w+);", text)
+        conf = fname[:-len(".sample")]
+        presets.append({
+            "name": m.group(1),
+            "type": m.group(2),
+            "port": int(port.group(1)) if port else None,
+            "proto": proto.group(1) if proto else "http",
+            "file": conf,
+            "enabled": os.path.exists(os.path.join(PROXY_CONFS_DIR, conf)),
+        })
+    return presets
+
 
 class Swag(BaseApp):
 
@@ -94,6 +170,7 @@ class Swag(BaseApp):
         for d in [
             "/config/nginx/site-confs",
             "/config/nginx/proxy-confs",
+            "/config/nginx/upstreams",
             "/config/dns-conf",
             "/config/keys",
             "/config/www",
@@ -110,9 +187,8 @@ class Swag(BaseApp):
 
         # ── Deploy nginx configs from templates ─────────────────────
         self.log.info("Deploying nginx configuration...")
-        self.deploy_provision_file("nginx.conf", "/etc/nginx/nginx.conf")
+        self._write_nginx_config()
         self.deploy_provision_file("ssl.conf", "/config/nginx/ssl.conf")
-        self.deploy_provision_file("proxy.conf", "/config/nginx/proxy.conf")
         self.deploy_provision_file("default-site.conf",
                                    "/config/nginx/site-confs/default.conf")
         self.deploy_provision_file("index.html", "/config/www/index.html")
@@ -138,6 +214,7 @@ class Swag(BaseApp):
             "--exclude=linux*/LICENSE",
         ], check=False)
         self.run_command(["rm", "-f", "/tmp/proxy-confs.tar.gz"])
+        self._sync_proxy_confs()
 
         # ── Clone SWAG defaults (dns-conf templates, fail2ban) ──────
         self.log.info("Fetching DNS credential templates and fail2ban configs...")
@@ -204,40 +281,47 @@ class Swag(BaseApp):
 
         # ── Generate self-signed cert (so nginx starts immediately) ─
         self.log.info("Generating self-signed certificate...")
+        key_type = self.inputs.string("key_type", "ecdsa-p256")
         self.run_command([
             "openssl", "req", "-x509", "-nodes",
             "-days", "365",
-            "-newkey", "rsa:2048",
+            *OPENSSL_KEY_ARGS.get(key_type, OPENSSL_KEY_ARGS["ecdsa-p256"]),
             "-keyout", "/config/keys/cert.key",
             "-out", "/config/keys/cert.crt",
             "-subj", "/CN=swag-selfsigned",
         ])
 
-        # ── Request Let's Encrypt cert (if domain is set) ──────────
-        if url:
-            self.log.info(f"Requesting certificate for {url}...")
-            self._request_certificate(
-                url, validation, dnsplugin, email,
-                subdomains, only_sub, staging, extra,
-            )
-
-        # ── Set up auto-renewal cron job ────────────────────────────
+        # ── Set up auto-renewal cron job and boot-time issuance resume ─
         self.deploy_provision_file(
             "certbot-renew.sh", "/etc/periodic/daily/certbot-renew",
             mode="0755",
         )
+        self.deploy_provision_file(
+            "cert-issue.start", "/etc/local.d/swag-cert-issue.start",
+            mode="0755",
+        )
+        self.run_command(["rc-update", "add", "local", "default"], check=False)
 
         # ── Enable and start services ───────────────────────────────
         self.log.info("Starting services...")
+        self.run_command(["nginx", "-t"])
         self.enable_service("nginx")
         self.enable_service("fail2ban")
         self.restart_service("nginx")
         self.restart_service("fail2ban")
 
+        # ── Request Let's Encrypt cert in the background ────────────
+        if url:
+            self.log.info(f"Requesting certificate for {url}...")
+            self._request_certificate(
+                url, validation, dnsplugin, email,
+                subdomains, only_sub, staging, extra,
+            )
+
         self.log.info("SWAG installation complete")
 
     def configure(self):
-        """Reconfigure — re-request certificate with updated inputs."""
+        """Reconfigure — rewrite nginx tuning and re-request certificate."""
         url         = self.inputs.string("url", "")
         validation  = self.inputs.string("validation", "http")
         dnsplugin   = self.inputs.string("dnsplugin", "cloudflare")
@@ -247,17 +331,192 @@ class Swag(BaseApp):
         staging     = self.inputs.boolean("staging", False)
         extra       = self.inputs.string("extra_domains", "")
 
+        self._write_nginx_config()
+        self._sync_proxy_confs()
+        self.run_command(["nginx", "-t"])
+        self.restart_service("nginx")
+
         if url:
             self.log.info(f"Re-requesting certificate for {url}...")
             self._request_certificate(
                 url, validation, dnsplugin, email,
                 subdomains, only_sub, staging, extra,
             )
-            self.restart_service("nginx")
+
+    def _write_nginx_config(self):
+        """Render nginx.conf, proxy.conf and the shared upstream pools."""
+        worker_connections = self.inputs.integer("worker_connections", 4096)
+        keepalive = self.inputs.integer("upstream_keepalive", 32)
+        cache_mb = self.inputs.integer("proxy_cache_mb", 0)
+        pools = _parse_upstreams(self.inputs.string("upstreams", ""))
+
+        if cache_mb > 0:
+            self.create_dir(CACHE_DIR, owner="nginx")
+
+        self.render_template("nginx.conf", "/etc/nginx/nginx.conf",
+            worker_connections=worker_connections,
+            # Proxying holds a client and an upstream descriptor per request
+            worker_rlimit_nofile=worker_connections * 2,
+            proxy_cache=cache_mb > 0,
+            proxy_cache_size=f"{cache_mb}m",
+        )
+        self.render_template("proxy.conf", f"{NGINX_DIR}/proxy.conf",
+            proxy_cache=cache_mb > 0,
+            # Requests carrying credentials may get per-user responses even
+            # for static paths, so they are never served from or stored in the cache
+            cache_bypass="$cookie_session $http_authorization $http_cookie $swag_no_cache"
+                         if cache_mb > 0 else "$cookie_session",
+        )
+
+        # Drop pools that were removed from the input, keep user-made files
+        self.create_dir(UPSTREAMS_DIR)
+        for fname in os.listdir(UPSTREAMS_DIR):
+            path = os.path.join(UPSTREAMS_DIR, fname)
+            if fname.endswith(".conf") and fname[:-5] not in pools:
+                with open(path) as f:
+                    managed = f.read().startswith(UPSTREAM_MARKER)
+                if managed:
+                    self.run_command(["rm", "-f", path])
+
+        for name, servers in pools.items():
+            self.render_template("upstream.conf", f"{UPSTREAMS_DIR}/{name}.conf",
+                name=name,
+                servers="\n".join(f"    server {srv} max_fails=3 fail_timeout=10s;"
+                                  for srv in servers),
+                keepalive=keepalive,
+            )
+        if pools:
+            self.log.info(f"Upstream keepalive pools: {', '.join(pools)}")
+
+    def _sync_proxy_confs(self):
+        """Enable the presets listed in proxy_confs and index the rest.
+
+        Each entry is an app name, optionally suffixed with .subdomain or
+        .subfolder (subdomain is preferred when both exist). Confs enabled by
+        an earlier run and since dropped from the list are removed, unless
+        they were edited by hand. Confs enabled manually are left alone.
+        """
+        presets = _scan_presets()
+        by_file = {p["file"]: p for p in presets}
+
+        wanted = []
+        for entry in self.inputs.string("proxy_confs", "").split(","):
+            name, _, kind = entry.strip().partition(".")
+            if not name:
+                continue
+            kinds = [kind] if kind else ["subdomain", "subfolder"]
+            match = next((f"{name}.{k}.conf" for k in kinds
+                          if f"{name}.{k}.conf" in by_file), None)
+            if match:
+                wanted.append(match)
+            else:
+                self.log.warning(f"No preset proxy conf named '{entry.strip()}'")
+
+        state = {}
+        if os.path.exists(ENABLED_STATE):
+            with open(ENABLED_STATE) as f:
+                state = json.load(f)
+        # Managed confs whose content is still what this app last wrote
+        pristine = {
+            fname for fname, digest in state.items()
+            if os.path.exists(os.path.join(PROXY_CONFS_DIR, fname))
+            and _file_hash(os.path.join(PROXY_CONFS_DIR, fname)) == digest
+        }
+
+        for fname in list(state):
+            if fname in wanted:
+                continue
+            if fname in pristine:
+                self.run_command(["rm", "-f", os.path.join(PROXY_CONFS_DIR, fname)])
+                self.log.info(f"Disabled proxy conf {fname}")
+            elif os.path.exists(os.path.join(PROXY_CONFS_DIR, fname)):
+                self.log.warning(f"Keeping {fname}: it was edited by hand")
+            del state[fname]
+
+        added = []
+        for fname in wanted:
+            path = os.path.join(PROXY_CONFS_DIR, fname)
+            if not os.path.exists(path):
+                self.run_command(["cp", f"{path}.sample", path])
+                added.append(fname)
+
+        self._use_upstream_pools()
+
+        for fname in wanted:
+            if fname in added or fname in pristine:
+                state[fname] = _file_hash(os.path.join(PROXY_CONFS_DIR, fname))
+        self.write_config(ENABLED_STATE, json.dumps(state, indent=2) + "\n")
+
+        for preset in presets:
+            preset["enabled"] = os.path.exists(os.path.join(PROXY_CONFS_DIR, preset["file"]))
+        self.write_config(PRESET_INDEX, json.dumps(presets, indent=2) + "\n")
+
+        enabled = [p["file"] for p in presets if p["enabled"]]
+        self.log.info(f"Indexed {len(presets)} preset proxy confs, "
+                      f"{len(enabled)} enabled: {', '.join(enabled) or 'none'}")
+
+    def _use_upstream_pools(self):
+        """Point enabled proxy confs at the matching upstream pool.
+
+        nginx only resolves ``proxy_pass`` to an ``upstream`` block when the
+        URL carries no port, so ``$upstream_app`` is set to the pool name and
+        ``:$upstream_port`` is dropped from the preset's ``proxy_pass`` line.
+        """
+        pools = _parse_upstreams(self.inputs.string("upstreams", ""))
+        for name in pools:
+            for kind in ("subdomain", "subfolder"):
+                path = f"{PROXY_CONFS_DIR}/{name}.{kind}.conf"
+                if not os.path.exists(path):
+                    continue
+                with open(path) as f:
+                    text = f.read()
+                updated = re.sub(r"(set \$upstream_app\s+)[^;]+;",
+                                 rf"\g<1>{name};", text)
+                updated = re.sub(r"(proxy_pass\s+\$upstream_proto://\$upstream_app):\$upstream_port",
+                                 r"\1", updated)
+                if updated != text:
+                    # Escape $ so the preset's nginx variables are kept verbatim, not substituted
+                    self.write_config(path, updated.replace("$", "$$"))
+                    self.log.info(f"{name}.{kind}.conf now uses upstream pool '{name}'")
+
+    def _stop_cert_issuer(self):
+        """Stop an issuer still retrying with the previous domains or key, so
+        the one started next runs with the new settings instead of exiting
+        on its lock."""
+        with open(CERT_ISSUE_LOCK, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                pass
+            try:
+                with open(CERT_ISSUE_PID) as f:
+                    # setsid made the issuer a process group leader; this
+                    # also stops its certbot run or backoff sleep
+                    os.killpg(int(f.read().strip()), signal.SIGTERM)
+            except (OSError, ValueError) as e:
+                self.log.warn(f"A certificate request is still running and could not be stopped ({e}); "
+                              "the new settings apply from its next start (at boot)")
+                return
+            deadline = time.monotonic() + 30
+            while time.monotonic() < deadline:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    self.log.info("Stopped the running certificate request to restart it with the new settings")
+                    return
+                except BlockingIOError:
+                    time.sleep(0.5)
+            self.log.warn("The running certificate request did not stop; "
+                          "the new settings apply from its next start (at boot)")
 
     def _request_certificate(self, url, validation, dnsplugin, email,
                               subdomains, only_sub, staging, extra):
-        """Build certbot command and request a certificate."""
+        """Build the certbot command and start issuance in the background.
+
+        Provisioning does not wait for validation (DNS propagation alone can
+        take minutes): nginx keeps serving the self-signed cert and the
+        issuance script swaps in the real one and reloads nginx when it lands.
+        """
         certbot = "/lsiopy/bin/certbot"
 
         # Build domain list
@@ -282,6 +541,12 @@ class Swag(BaseApp):
             self.log.warning("No domains to request certificate for")
             return
 
+        if only_sub and subdomains != "wildcard":
+            first_sub = subdomains.split(",")[0].strip()
+            cert_domain = f"{first_sub}.{url}"
+        else:
+            cert_domain = url
+
         # Base certbot command
         cmd = [
             certbot, "certonly",
@@ -297,6 +562,12 @@ class Swag(BaseApp):
         for d in domains:
             cmd.extend(["-d", d])
 
+        # Key type; naming the lineage lets certbot switch an existing
+        # certificate's key type without an interactive prompt
+        key_type = self.inputs.string("key_type", "ecdsa-p256")
+        cmd.extend(CERTBOT_KEY_ARGS.get(key_type, CERTBOT_KEY_ARGS["ecdsa-p256"]))
+        cmd.extend(["--cert-name", cert_domain])
+
         # Email or register without
         if email and "@" in email:
             cmd.extend(["--email", email, "--no-eff-email"])
@@ -323,34 +594,31 @@ class Swag(BaseApp):
                 cred_file = f"/config/dns-conf/{dnsplugin}.{ext}"
                 cmd.extend([f"--{plugin}-credentials", cred_file])
         else:
+            # nginx already owns port 80 and serves the challenge directory
             cmd.extend([
-                "--authenticator", "standalone",
+                "--authenticator", "webroot",
+                "--webroot-path", "/config/www",
                 "--preferred-challenges", "http",
             ])
 
-        self.log.info(f"Certbot: requesting cert for {', '.join(domains)}")
-        self.run_command(cmd, check=False)
-
-        # Update cert symlinks if certbot succeeded
-        if only_sub and subdomains != "wildcard":
-            first_sub = subdomains.split(",")[0].strip()
-            cert_domain = f"{first_sub}.{url}"
-        else:
-            cert_domain = url
-
         cert_path = f"/config/etc/letsencrypt/live/{cert_domain}"
 
-        # If cert was generated, replace self-signed with symlinks
-        self.run_command(["sh", "-c", f"""
-            if [ -d {cert_path} ]; then
-                rm -f /config/keys/cert.crt /config/keys/cert.key
-                ln -s {cert_path}/fullchain.pem /config/keys/cert.crt
-                ln -s {cert_path}/privkey.pem /config/keys/cert.key
-                echo "Certificate installed successfully"
-            else
-                echo "Certificate not found at {cert_path} — using self-signed cert"
-            fi
-        """])
+        # sh reads a script as it runs: render the new one beside it and swap
+        # it in, so a running issuer keeps executing the old file intact
+        self.render_template("cert-issue.sh", f"{CERT_ISSUE_SCRIPT}.new",
+            certbot_cmd=shlex.join(cmd),
+            cert_path=cert_path,
+            attempts=CERT_ISSUE_ATTEMPTS,
+        )
+        self.run_command(["chmod", "0755", f"{CERT_ISSUE_SCRIPT}.new"])
+        os.replace(f"{CERT_ISSUE_SCRIPT}.new", CERT_ISSUE_SCRIPT)
+        self.write_config(CERT_PENDING, f"{', '.join(domains)}\n")
+        self._stop_cert_issuer()
+
+        self.log.info(f"Certbot: requesting cert for {', '.join(domains)} "
+                      "in the background (log: /config/log/letsencrypt/issue.log)")
+        self.run_command(["sh", "-c",
+            f"setsid {CERT_ISSUE_SCRIPT} </dev/null >/dev/null 2>&1 &"])
 
 
 run(Swag)
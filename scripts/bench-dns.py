@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""Replay a DNS query trace against a resolver and report QPS and cache hits.
+
+Meant for sizing Pi-hole's FTL cache: replay the same trace with different
+cache_size settings and compare. The trace is either a text file (one
+"name [type]" per line) or the query table of a pihole-FTL.db copy:
+
+    ./scripts/bench-dns.py 10.0.0.53 --trace queries.txt --passes 2
+    ./scripts/bench-dns.py 10.0.0.53 --ftl-db pihole-FTL.db --limit 50000 \\
+        --api http://10.0.0.53:8155 --password secret
+
+Cache hits are read from the FTL API (queries answered from cache during
+the run) when --api is given, otherwise estimated from answers faster than
+--hit-ms. Standard library only.
+"""
+
+import argparse
+import json
+import random
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import urllib.request
+
+QTYPES = {"A": 1, "NS": 2, "CNAME": 5, "SOA": 6, "PTR": 12, "MX": 15,
+          "TXT": 16, "AAAA": 28, "SRV": 33, "SVCB": 64, "HTTPS": 65}
+# pihole-FTL.db query types → DNS QTYPE
+FTL_TYPES = {1: 1, 2: 28, 4: 33, 5: 6, 6: 12, 7: 16, 9: 15, 13: 2, 15: 64, 16: 65}
+RCODES = {0: "NOERROR", 2: "SERVFAIL", 3: "NXDOMAIN", 5: "REFUSED"}
+
+
+def load_trace(args):
+    if args.ftl_db:
+        db = sqlite3.connect(f"file:{args.ftl_db}?mode=ro", uri=True)
+        rows = db.execute("SELECT domain, type FROM queries ORDER BY id DESC LIMIT ?",
+                          (args.limit,)).fetchall()
+        db.close()
+        # Oldest first, as the clients sent them
+        return [(name, FTL_TYPES.get(qtype, 1)) for name, qtype in reversed(rows)]
+
+    trace = []
+    with open(args.trace) as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith("#"):
+                continue
+            qtype = QTYPES.get(parts[1].upper(), 1) if len(parts) > 1 else 1
+            trace.append((parts[0].rstrip("."), qtype))
+    return trace[:args.limit] if args.limit else trace
+
+
+def build_query(qid, name, qtype):
+    header = struct.pack(">HHHHHH", qid, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(bytes([len(label)]) + label.encode("idna")
+                     for label in name.split(".") if label) + b"\0"
+    return header + qname + struct.pack(">HH", qtype, 1)
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.rcodes = {}
+        self.timeouts = 0
+        self.errors = 0
+
+
+def worker(server, port, queue, lock, results, timeout):
+    sock = socket.socket(socket.AF_INET6 if ":" in server else socket.AF_INET,
+                         socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    sock.connect((server, port))
+    latencies, rcodes, timeouts, errors = [], {}, 0, 0
+    while True:
+        with lock:
+            if not queue:
+                break
+            name, qtype = queue.pop()
+        qid = random.getrandbits(16)
+        try:
+            packet = build_query(qid, name, qtype)
+        except (UnicodeError, ValueError):
+            continue
+        start = time.perf_counter()
+        try:
+            sock.send(packet)
+            while True:
+                reply = sock.recv(4096)
+                if len(reply) >= 4 and struct.unpack(">H", reply[:2])[0] == qid:
+                    break
+        except socket.timeout:
+            timeouts += 1
+            continue
+        except OSError:
+            # e.g. ICMP port unreachable surfacing as ECONNREFUSED
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        rcode = reply[3] & 0x0F
+        rcodes[rcode] = rcodes.get(rcode, 0) + 1
+    sock.close()
+    with results.lock:
+        results.latencies += latencies
+        results.timeouts += timeouts
+        results.errors += errors
+        for rcode, count in rcodes.items():
+            results.rcodes[rcode] = results.rcodes.get(rcode, 0) + count
+
+
+class FtlApi:
+    """Minimal Pi-hole v6 API client for the query counters."""
+
+    def __init__(self, base, password):
+        self.base = base.rstrip("/")
+        self.sid = None
+        if password:
+            reply = self._request("/api/auth", {"password": password})
+            self.sid = reply["session"]["sid"]
+
+    def _request(self, path, body=None):
+        req = urllib.request.Request(
+            self.base + path,
+            data=json.dumps(body).encode() if body is not None else None,
+            headers={"Content-Type": "application/json",
+                     **({"X-FTL-SID": self.sid} if self.sid else {})},
+        )
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return json.load(resp)
+
+    def counters(self):
+        queries = self._request("/api/stats/summary")["queries"]
+        return queries["total"], queries["cached"]
+
+    def logout(self):
+        if self.sid:
+            req = urllib.request.Request(self.base + "/api/auth", method="DELETE",
+                                         headers={"X-FTL-SID": self.sid})
+            urllib.request.urlopen(req, timeout=10).close()
+
+
+def run_pass(args, trace, api):
+    queue = list(reversed(trace))
+    lock = threading.Lock()
+    results = Results()
+    before = api.counters() if api else None
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker,
+                                args=(args.server, args.port, queue, lock, results, args.timeout))
+               for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    lat = sorted(results.latencies)
+    answered = len(lat)
+    if api:
+        total, cached = (a - b for a, b in zip(api.counters(), before))
+        hit_rate = cached / total * 100 if total else 0.0
+        hit_source = "FTL API"
+    else:
+        hits = sum(1 for x in lat if x * 1000 < args.hit_ms)
+        hit_rate = hits / answered * 100 if answered else 0.0
+        hit_source = f"answers < {args.hit_ms} ms"
+
+    def pct(p):
+        return lat[min(len(lat) - 1, int(len(lat) * p / 100))] * 1000 if lat else 0.0
+
+    return {
+        "queries": len(trace),
+        "answered": answered,
+        "timeouts": results.timeouts,
+        "errors": results.errors,
+        "qps": answered / elapsed if elapsed else 0.0,
+        "p50_ms": pct(50),
+        "p99_ms": pct(99),
+        "hit_rate": hit_rate,
+        "hit_source": hit_source,
+        "rcodes": {RCODES.get(k, str(k)): v for k, v in sorted(results.rcodes.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("server", help="resolver address, e.g. the Pi-hole container IP")
+    parser.add_argument("-p", "--port", type=int, default=53)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help='text file with one "name [type]" per line')
+    source.add_argument("--ftl-db", help="copy of /etc/pihole/pihole-FTL.db to replay")
+    parser.add_argument("--limit", type=int, default=0,
+                        help="replay at most this many queries (default: all; 100000 for --ftl-db)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="parallel clients")
+    parser.add_argument("--passes", type=int, default=1,
+                        help="replay the trace this many times (later passes show a warm cache)")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-query timeout, seconds")
+    parser.add_argument("--hit-ms", type=float, default=1.0,
+                        help="latency below which an answer counts as a cache hit without --api")
+    parser.add_argument("--api", help="Pi-hole web URL for exact cache counters, e.g. http://10.0.0.53:8155")
+    parser.add_argument("--password", default="", help="Pi-hole web password for --api")
+    args = parser.parse_args()
+    if args.ftl_db and not args.limit:
+        args.limit = 100000
+
+    trace = load_trace(args)
+    if not trace:
+        sys.exit("empty trace")
+    api = FtlApi(args.api, args.password) if args.api else None
+
+    answered = 0
+    print(f"Replaying {len(trace)} queries against {args.server}:{args.port} "
+          f"with {args.concurrency} clients")
+    try:
+        for n in range(1, args.passes + 1):
+            r = run_pass(args, trace, api)
+            answered += r["answered"]
+            rcodes = ", ".join(f"{k} {v}" for k, v in r["rcodes"].items())
+            print(f"Pass {n}: {r['qps']:.0f} qps, p50 {r['p50_ms']:.2f} ms, "
+                  f"p99 {r['p99_ms']:.2f} ms, cache hits {r['hit_rate']:.1f}% "
+                  f"({r['hit_source']}), timeouts {r['timeouts']}, errors {r['errors']}  [{rcodes}]")
+    finally:
+        if api:
+            api.logout()
+    return 1 if answered == 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
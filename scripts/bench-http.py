@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""wrk-style HTTP/1.1 load driver for comparing web server profiles.
+
+Opens a fixed number of keep-alive connections and issues GET requests
+back-to-back for a set duration, then reports requests/sec, throughput and
+latency percentiles. Results can be saved and compared against a later run:
+
+    ./scripts/bench-http.py http://10.0.0.50/ -c 64 -d 15 --save before.json
+    # ... apply the new profile ...
+    ./scripts/bench-http.py http://10.0.0.50/ -c 64 -d 15 --compare before.json
+
+Standard library only. https:// URLs (or --tls) skip certificate
+verification so self-signed test certificates work.
+"""
+
+import argparse
+import asyncio
+import json
+import ssl
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.bytes = 0
+        self.errors = 0
+        self.non_2xx = 0
+
+
+async def read_response(reader):
+    """Read one response; return (status, body_bytes, keep_alive)."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    size = 0
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            chunk_len = int((await reader.readline()).split(b";")[0], 16)
+            if chunk_len == 0:
+                await reader.readuntil(b"\r\n")
+                break
+            size += len(await reader.readexactly(chunk_len + 2)) - 2
+    elif "content-length" in headers:
+        size = len(await reader.readexactly(int(headers["content-length"])))
+    connection = headers.get("connection", "").lower()
+    if lines[0].startswith("HTTP/1.0"):
+        keep_alive = connection == "keep-alive"
+    else:
+        keep_alive = connection != "close"
+    return status, len(head) + size, keep_alive
+
+
+async def worker(url, request, deadline, stats, tls):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(
+                    url.hostname, url.port or (443 if tls else 80), ssl=tls)
+            start = time.perf_counter()
+            writer.write(request)
+            status, size, keep_alive = await read_response(reader)
+            stats.latencies.append(time.perf_counter() - start)
+            stats.bytes += size
+            if not 200 <= status < 300:
+                stats.non_2xx += 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats.errors += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+async def bench(args):
+    url = urlsplit(args.url)
+    tls = None
+    if url.scheme == "https" or args.tls:
+        tls = ssl.create_default_context()
+        tls.check_hostname = False
+        tls.verify_mode = ssl.CERT_NONE
+    path = (url.path or "/") + (f"?{url.query}" if url.query else "")
+    header_lines = [f"GET {path} HTTP/1.1", f"Host: {url.netloc}",
+                    "User-Agent: bench-http", "Connection: keep-alive"]
+    header_lines += args.header
+    request = ("\r\n".join(header_lines) + "\r\n\r\n").encode()
+
+    stats = Stats()
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*(worker(url, request, deadline, stats, tls)
+                           for _ in range(args.connections)))
+    elapsed = time.monotonic() - start
+
+    lat = sorted(stats.latencies)
+    return {
+        "url": args.url,
+        "connections": args.connections,
+        "duration": round(elapsed, 2),
+        "requests": len(lat),
+        "requests_per_sec": round(len(lat) / elapsed, 1),
+        "transfer_mb_per_sec": round(stats.bytes / elapsed / 1048576, 2),
+        "latency_ms": {
+            "avg": round(sum(lat) / len(lat) * 1000, 2) if lat else 0.0,
+            "p50": round(percentile(lat, 50) * 1000, 2),
+            "p90": round(percentile(lat, 90) * 1000, 2),
+            "p99": round(percentile(lat, 99) * 1000, 2),
+            "max": round(lat[-1] * 1000, 2) if lat else 0.0,
+        },
+        "errors": stats.errors,
+        "non_2xx": stats.non_2xx,
+    }
+
+
+def report(result, baseline=None):
+    def delta(new, old, lower_is_better=False):
+        if not baseline or not old:
+            return ""
+        change = (new - old) / old * 100
+        if abs(change) < 0.05:
+            return "  (no change)"
+        better = change < 0 if lower_is_better else change > 0
+        return f"  ({change:+.1f}% {'better' if better else 'worse'})"
+
+    base = baseline or {}
+    base_lat = base.get("latency_ms", {})
+    print(f"{result['url']}: {result['connections']} connections, {result['duration']}s")
+    print(f"  Requests/sec: {result['requests_per_sec']:>10}"
+          f"{delta(result['requests_per_sec'], base.get('requests_per_sec'))}")
+    print(f"  Transfer/sec: {result['transfer_mb_per_sec']:>10} MB")
+    for key in ("avg", "p50", "p90", "p99", "max"):
+        value = result["latency_ms"][key]
+        print(f"  Latency {key:>4}: {value:>10} ms{delta(value, base_lat.get(key), True)}")
+    print(f"  Requests: {result['requests']}  errors: {result['errors']}  non-2xx: {result['non_2xx']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("url", help="URL to request, e.g. http://10.0.0.50/")
+    parser.add_argument("-c", "--connections", type=int, default=32)
+    parser.add_argument("-d", "--duration", type=float, default=10, help="seconds")
+    parser.add_argument("-H", "--header", action="append", default=[],
+                        help='extra request header, e.g. "Accept-Encoding: gzip"')
+    parser.add_argument("--tls", action="store_true", help="use TLS without verifying the certificate")
+    parser.add_argument("--save", help="write the result as JSON to this file")
+    parser.add_argument("--compare", help="JSON result of an earlier run to compare against")
+    args = parser.parse_args()
+
+    result = asyncio.run(bench(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(result, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+    return 1 if result["requests"] == 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""Plan a multi-app stack install with shared package and service work merged.
+
+Reads each app's provision/install.py (statically, nothing is executed) and
+app.yml, and prints the order a stack install should run in:
+
+    1. every repository the apps add, deduplicated
+    2. one package index refresh
+    3. one package transaction with the union of the apps' base packages
+    4. each app's install.py, whose package calls are then already satisfied
+    5. one restart per service, after the last app
+
+    ./scripts/plan-stack.py jellyfin plex qbittorrent
+    ./scripts/plan-stack.py homeassistant crawl4ai --json > plan.json
+
+Only package calls made unconditionally from install() with literal names
+are merged. Calls inside if/try/loops or helper methods, and installs that
+follow an os.environ change (e.g. GitLab's EXTERNAL_URL) stay with their
+app; pip installs follow the same rule. Services are restarted by the plan only when install() always sets
+them up, directly or through methods it always calls (such as configure());
+services behind an input (e.g. a recorder database) stay with their app.
+Apps that cannot share a container (different OS templates, the same
+service or default port) are reported as conflicts and exit non-zero.
+"""
+
+import argparse
+import ast
+import json
+import os
+import sys
+
+import yaml
+
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "apps")
+PACKAGE_CALLS = ("pkg_install", "apt_install")
+REPO_CALLS = ("add_apt_repository", "enable_repo")
+SERVICE_CALLS = ("create_service", "enable_service", "restart_service")
+# Calls that (re)start a service
+START_CALLS = ("enable_service", "restart_service")
+# Nested statements whose bodies may not run
+CONDITIONAL = (ast.If, ast.Try, ast.For, ast.While, ast.With, ast.AsyncFor, ast.AsyncWith)
+
+
+def _literal(node, constants):
+    """Value of a literal or of a module-level constant, else None."""
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+def _sdk_call(node):
+    """Method name of a self.<name>(...) call, or None."""
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == "self"):
+        return node.func.attr
+    return None
+
+
+def _sets_environ(stmt):
+    """True for statements like os.environ["X"] = ... or os.environ.update(...)."""
+    for node in ast.walk(stmt):
+        target = None
+        if isinstance(node, ast.Assign):
+            target = node.targets[0]
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            target = node.func.value
+        if isinstance(target, ast.Subscript):
+            target = target.value
+        if isinstance(target, ast.Attribute) and target.attr == "environ":
+            return True
+    return False
+
+
+class AppCalls:
+    """SDK calls found in one install.py."""
+
+    def __init__(self, path):
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        self.base_packages = []   # merged into the shared transaction
+        self.app_packages = []    # left to the app's own install step
+        self.dynamic_installs = 0
+        self.package_calls = 0
+        self.repos = []
+        self.installer_scripts = []
+        self.pip = {}             # venv → packages install() always pip-installs
+        self.app_pip = {}         # venv → packages pip-installed conditionally
+        self.pip_calls = []       # (call, venv, packages) for every pip_install
+        self.services = []        # every service the script touches
+        self.base_services = []   # those install() always sets up
+        self.restarts = 0
+        # Module-level NAME = "literal" assignments, e.g. VENV = "/srv/app/venv"
+        self.constants = {
+            node.targets[0].id: node.value.value for node in tree.body
+            if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name)
+            and isinstance(node.value, ast.Constant)
+        }
+
+        # Module functions and class methods; walking each once also covers
+        # the functions nested in them, without counting their calls twice
+        self.methods = {}
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef):
+                funcs = [n for n in node.body if isinstance(n, ast.FunctionDef)]
+            elif isinstance(node, ast.FunctionDef):
+                funcs = [node]
+            else:
+                continue
+            for func in funcs:
+                self.methods.setdefault(func.name, func)
+                for call in ast.walk(func):
+                    self._record(_sdk_call(call), call)
+        install = self.methods.get("install")
+        base_pip = set()
+        if install:
+            base_pip = self._base_packages(install)
+            self._base_services(install, {"install"})
+        for call, venv, pkgs in self.pip_calls:
+            target = self.pip if call in base_pip else self.app_pip
+            target.setdefault(venv, []).extend(pkgs)
+
+    def _record(self, name, call):
+        if name is None:
+            return
+        args = [_literal(a, self.constants) for a in call.args]
+        kwargs = {k.arg: _literal(k.value, self.constants) for k in call.keywords if k.arg}
+        if name in PACKAGE_CALLS:
+            self.package_calls += 1
+        elif name in REPO_CALLS:
+            self.repos.append({"call": name, "args": args, **kwargs})
+        elif name == "run_installer_script":
+            self.installer_scripts.append(args[0] if args else None)
+        elif name == "pip_install":
+            venv = kwargs.get("venv") or ("(computed venv)" if "venv" in kwargs else "system")
+            self.pip_calls.append((call, venv, [a for a in args if isinstance(a, str)]))
+        elif name in SERVICE_CALLS and args and isinstance(args[0], str):
+            if args[0] not in self.services:
+                self.services.append(args[0])
+            if name in START_CALLS:
+                self.restarts += 1
+
+    def _base_packages(self, install):
+        """Sort install()'s package calls into shared and app-ordered ones;
+        returns the pip_install calls that always run."""
+        environ_changed = False
+        base_pip = set()
+        for stmt in install.body:
+            environ_changed = environ_changed or _sets_environ(stmt)
+            for node in ast.walk(stmt):
+                name = _sdk_call(node)
+                if name == "pip_install":
+                    if not (isinstance(stmt, CONDITIONAL) or environ_changed):
+                        base_pip.add(node)
+                    continue
+                if name not in PACKAGE_CALLS:
+                    continue
+                names = [_literal(a, self.constants) for a in node.args]
+                if any(not isinstance(n, str) for n in names):
+                    self.dynamic_installs += 1
+                    continue
+                if isinstance(stmt, CONDITIONAL) or environ_changed:
+                    self.app_packages += names
+                else:
+                    self.base_packages += names
+        return base_pip
+
+    def _base_services(self, func, visited):
+        """Collect services set up by func's unconditional statements,
+        following the self.<method>() calls among them."""
+        for stmt in func.body:
+            if isinstance(stmt, CONDITIONAL):
+                # An early return makes everything after it conditional too
+                if any(isinstance(node, ast.Return) for node in ast.walk(stmt)):
+                    return
+                continue
+            for node in ast.walk(stmt):
+                name = _sdk_call(node)
+                if name in SERVICE_CALLS and node.args:
+                    service = _literal(node.args[0], self.constants)
+                    if isinstance(service, str) and service not in self.base_services:
+                        self.base_services.append(service)
+                elif name in self.methods and name not in visited:
+                    visited.add(name)
+                    self._base_services(self.methods[name], visited)
+
+
+def load_app(ref):
+    app_dir = ref if os.path.isdir(ref) else os.path.join(CATALOG_DIR, ref)
+    manifest_path = os.path.join(app_dir, "app.yml")
+    if not os.path.exists(manifest_path):
+        sys.exit(f"{ref}: no app.yml (give an app id or an app directory)")
+    with open(manifest_path) as f:
+        manifest = yaml.safe_load(f)
+    script = os.path.join(app_dir, manifest.get("provisioning", {}).get("script", "provision/install.py"))
+    return manifest, AppCalls(script)
+
+
+def build_plan(refs):
+    apps = [(ref, *load_app(ref)) for ref in refs]
+    plan = {"apps": [], "repositories": [], "packages": [], "pip": {}, "restarts": [],
+            "conflicts": [], "warnings": [], "savings": {}}
+
+    templates = {m["lxc"]["ostemplate"] for _, m, _ in apps}
+    if len(templates) > 1:
+        plan["conflicts"].append(
+            "apps need different OS templates: " +
+            ", ".join(f"{m['id']} ({m['lxc']['ostemplate']})" for _, m, _ in apps))
+
+    seen_repos, seen_packages = set(), set()
+    service_owner, port_owner = {}, {}
+    package_calls = restarts = refreshing_apps = 0
+    for ref, manifest, calls in apps:
+        app_id = manifest["id"]
+        declared = set(manifest.get("permissions", {}).get("packages") or [])
+        package_calls += calls.package_calls
+        restarts += calls.restarts
+        # Every app that adds a repository or installs packages refreshes the index at least once
+        refreshing_apps += bool(calls.package_calls or calls.repos or calls.installer_scripts)
+
+        for repo in calls.repos:
+            key = json.dumps(repo, sort_keys=True)
+            if key not in seen_repos:
+                seen_repos.add(key)
+                plan["repositories"].append({"app": app_id, **repo})
+        for name in calls.base_packages:
+            if name not in seen_packages:
+                seen_packages.add(name)
+                plan["packages"].append(name)
+        for name in calls.base_packages + calls.app_packages:
+            if declared and name not in declared:
+                plan["warnings"].append(f"{app_id}: installs {name}, which permissions.packages does not list")
+        for venv, pkgs in calls.pip.items():
+            plan["pip"].setdefault(venv, [])
+            plan["pip"][venv] += [p for p in pkgs if p not in plan["pip"][venv]]
+        if calls.dynamic_installs:
+            plan["warnings"].append(f"{app_id}: {calls.dynamic_installs} package call(s) with computed "
+                                    f"names stay in its install step")
+
+        app_services = [s for s in calls.services if s not in calls.base_services]
+        for service in calls.services:
+            if service in service_owner:
+                owner, always = service_owner[service]
+                if always and service in calls.base_services:
+                    plan["conflicts"].append(f"{app_id} and {owner} both manage service {service}")
+                else:
+                    plan["warnings"].append(f"{app_id} and {owner} may both manage service {service}, "
+                                            f"depending on their inputs")
+                continue
+            service_owner[service] = (app_id, service in calls.base_services)
+            if service in calls.base_services:
+                plan["restarts"].append(service)
+        for field in manifest.get("inputs") or []:
+            if field["key"].endswith("port") and field.get("default"):
+                port = int(field["default"])
+                if port in port_owner and port_owner[port] != app_id:
+                    plan["conflicts"].append(f"{app_id}.{field['key']} and {port_owner[port]} "
+                                             f"both default to port {port}")
+                port_owner.setdefault(port, app_id)
+
+        plan["apps"].append({
+            "id": app_id,
+            "ostemplate": manifest["lxc"]["ostemplate"],
+            "install_script": manifest.get("provisioning", {}).get("script", "provision/install.py"),
+            "timeout_sec": manifest.get("provisioning", {}).get("timeout_sec"),
+            "app_packages": calls.app_packages,
+            "app_pip": calls.app_pip,
+            "app_services": app_services,
+            "installer_scripts": calls.installer_scripts,
+        })
+
+    plan["savings"] = {
+        "package_calls": package_calls,
+        "package_transactions": 1 if plan["packages"] else 0,
+        "index_refreshes_before": refreshing_apps,
+        "index_refreshes": 1 if plan["repositories"] or plan["packages"] else 0,
+        "service_restarts": restarts,
+        "restarts_after_merge": len(plan["restarts"]),
+        "duplicate_packages": sum(len(c.base_packages) for _, _, c in apps) - len(plan["packages"]),
+    }
+    return plan
+
+
+def print_plan(plan):
+    ids = ", ".join(a["id"] for a in plan["apps"])
+    print(f"Stack: {ids}\n")
+    step = 1
+    if plan["repositories"]:
+        print(f"{step}. Add repositories")
+        for repo in plan["repositories"]:
+            target = repo["args"][0] if repo["args"] else repo.get("name")
+            print(f"     {repo['call']} {target}  ({repo['app']})")
+        step += 1
+    if plan["packages"]:
+        print(f"{step}. Refresh the package index once")
+        print(f"{step + 1}. Install {len(plan['packages'])} packages in one transaction")
+        print("     " + " ".join(plan["packages"]))
+        step += 2
+    for venv, pkgs in plan["pip"].items():
+        print(f"   pip into {venv}, run by its app: {' '.join(pkgs)}")
+    print(f"{step}. Run each app's install step with restarts deferred")
+    for app in plan["apps"]:
+        extra = []
+        if app["app_packages"]:
+            extra.append("own packages: " + " ".join(app["app_packages"]))
+        for venv, pkgs in app["app_pip"].items():
+            extra.append(f"own pip into {venv}: " + " ".join(pkgs))
+        if app["installer_scripts"]:
+            extra.append("installer: " + " ".join(str(s) for s in app["installer_scripts"]))
+        if app["app_services"]:
+            extra.append("own services: " + " ".join(app["app_services"]))
+        print(f"     {app['id']}" + (f"  ({'; '.join(extra)})" if extra else ""))
+    step += 1
+    if plan["restarts"]:
+        print(f"{step}. Start or restart each installed service once: {' '.join(plan['restarts'])}")
+
+    s = plan["savings"]
+    print(f"\n{s['package_calls']} package calls → {s['package_transactions']} transaction "
+          f"({s['duplicate_packages']} duplicate packages dropped), "
+          f"{s['index_refreshes_before']}+ index refreshes → {s['index_refreshes']}, "
+          f"{s['service_restarts']} service starts → {s['restarts_after_merge']}")
+    for warning in plan["warnings"]:
+        print(f"warning: {warning}")
+    for conflict in plan["conflicts"]:
+        print(f"conflict: {conflict}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("apps", nargs="+", help="app ids (apps/<id>) or app directories")
+    parser.add_argument("--json", action="store_true", help="print the plan as JSON")
+    args = parser.parse_args()
+
+    plan = build_plan(args.apps)
+    if args.json:
+        json.dump(plan, sys.stdout, indent=2)
+        print()
+    else:
+        print_plan(plan)
+    return 1 if plan["conflicts"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())